@@ -0,0 +1,63 @@
+"""
+write / read throughput and ratio of every open_compressed codec and level, on a synthetic tsv payload.
+    python benchmarks/bench_compression.py --size-mb 256 --zstd-threads -1
+"""
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+
+from mzutils.os_funcs import open_compressed
+
+LEVELS = {'gzip': (1, 6, 9), 'bz2': (1, 9), 'xz': (0, 6), 'zstd': (1, 3, 9, 19)}
+
+
+def make_payload(size_bytes):
+    rows = ('%d\tsentence number %d about topic %d\t%f\n' % (i, i * 7, i % 97, i / 3.0) for i in range(size_bytes))
+    chunks, total = [], 0
+    for row in rows:
+        chunks.append(row)
+        total += len(row)
+        if total >= size_bytes:
+            break
+    return ''.join(chunks).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=float, default=64)
+    parser.add_argument('--zstd-threads', type=int, default=0, help='0 single-threaded, -1 all cores.')
+    parser.add_argument('--codecs', nargs='*', default=list(LEVELS))
+    args = parser.parse_args()
+    payload = make_payload(int(args.size_mb * (1 << 20)))
+    size_mb = len(payload) / (1 << 20)
+    directory = tempfile.mkdtemp()
+    print('%-6s %5s %12s %12s %8s' % ('codec', 'level', 'write MB/s', 'read MB/s', 'ratio'))
+    for codec in [None] + args.codecs:
+        for level in (None,) if codec is None else LEVELS[codec]:
+            compression = None if codec is None else {'method': codec, 'level': level}
+            if codec == 'zstd':
+                if importlib.util.find_spec('zstandard') is None:
+                    print('zstd skipped, zstandard is not installed.')
+                    break
+                compression['threads'] = args.zstd_threads
+            path = os.path.join(directory, 'bench.tsv')
+            start = time.perf_counter()
+            with open_compressed(path, 'wb', compression) as fp:
+                fp.write(payload)
+            write_s = time.perf_counter() - start
+            start = time.perf_counter()
+            with open_compressed(path, 'rb', None if codec is None else codec) as fp:
+                while fp.read(1 << 20):
+                    pass
+            read_s = time.perf_counter() - start
+            print('%-6s %5s %12.1f %12.1f %8.2f' % (codec or 'none', '-' if level is None else level,
+                                                    size_mb / write_s, size_mb / read_s,
+                                                    len(payload) / os.path.getsize(path)))
+            os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+memory of iter_tsv vs read_tsv on a large synthetic tsv: iter_tsv should keep a flat RSS whatever the file size.
+    python benchmarks/bench_iter_tsv.py --size-gb 5
+    python benchmarks/bench_iter_tsv.py --size-gb 0.2 --read-tsv  # read_tsv for comparison, on a file that fits
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from mzutils.ctsv_funcs import iter_tsv, read_tsv
+
+
+def rss_mb():
+    with open('/proc/self/status') as fp:
+        for line in fp:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_tsv(path, size_bytes):
+    row = '\t'.join(['12345', 'some text in a column', '3.14159', 'another, longer text column value']) + '\n'
+    block = row * 10000
+    with open(path, 'w', encoding='utf-8') as fp:
+        written = 0
+        while written < size_bytes:
+            fp.write(block)
+            written += len(block)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-gb', type=float, default=5)
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--read-tsv', action='store_true', help='also load the whole file with read_tsv.')
+    parser.add_argument('--path', default=None, help='reuse this file instead of a temporary one.')
+    args = parser.parse_args()
+    path = args.path or os.path.join(tempfile.mkdtemp(), 'bench.tsv')
+    if not os.path.exists(path):
+        make_tsv(path, int(args.size_gb * (1 << 30)))
+    size_mb = os.path.getsize(path) / (1 << 20)
+    print('file: %s (%.0f MB), rss before: %.0f MB' % (path, size_mb, rss_mb()))
+
+    start, rows, samples = time.perf_counter(), 0, []
+    for item in iter_tsv(path, batch_size=args.batch_size):
+        rows += 1 if args.batch_size is None else len(item)
+        if rows % 1000000 < (1 if args.batch_size is None else args.batch_size):
+            samples.append(rss_mb())
+    elapsed = time.perf_counter() - start
+    print('iter_tsv: %d rows in %.1fs (%.0f MB/s), rss min/max while iterating: %.0f / %.0f MB'
+          % (rows, elapsed, size_mb / elapsed, min(samples or [rss_mb()]), max(samples or [rss_mb()])))
+
+    if args.read_tsv:
+        start = time.perf_counter()
+        result = read_tsv(path)
+        print('read_tsv: %d rows in %.1fs, rss holding the rows: %.0f MB'
+              % (len(result), time.perf_counter() - start, rss_mb()))
+    if args.path is None:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+load_json / dump_json time per installed backend, on a synthetic SQuAD-style nested QA dataset.
+    python benchmarks/bench_json_backends.py --articles 2000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from mzutils.json_funcs import JSON_BACKENDS, dump_json, load_json
+
+
+def make_squad_like(n_articles, seed=0):
+    rng = random.Random(seed)
+    words = ['the', 'model', 'answer', 'question', 'paragraph', 'context', 'token', 'università', 'naïve', 'data']
+
+    def text(n):
+        return ' '.join(rng.choice(words) for _ in range(n))
+
+    return {'version': '1.1', 'data': [{'title': text(3), 'paragraphs': [{
+        'context': text(120),
+        'qas': [{'id': '%d-%d-%d' % (a, p, q), 'question': text(12),
+                 'answers': [{'answer_start': rng.randrange(500), 'text': text(3)} for _ in range(3)]}
+                for q in range(5)]} for p in range(10)]} for a in range(n_articles)]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    dataset = make_squad_like(args.articles)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench.json')
+    print('%-8s %-12s %10s %10s %10s' % ('backend', 'ensure_ascii', 'dump s', 'load s', 'MB'))
+    for backend in JSON_BACKENDS:
+        try:
+            __import__(backend)
+        except ImportError:
+            print('%s skipped, not installed.' % backend)
+            continue
+        for ensure_ascii in (True, False):
+            dump_s = load_s = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                dump_json(dataset, path, ensure_ascii=ensure_ascii, backend=backend)
+                dump_s = min(dump_s, time.perf_counter() - start)
+                start = time.perf_counter()
+                loaded = load_json(path, backend=backend)
+                load_s = min(load_s, time.perf_counter() - start)
+            assert loaded == dataset
+            print('%-8s %-12s %10.3f %10.3f %10.1f' % (backend, ensure_ascii, dump_s, load_s,
+                                                     os.path.getsize(path) / (1 << 20)))
+    os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
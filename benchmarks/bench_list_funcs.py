@@ -0,0 +1,63 @@
+"""
+list_funcs at 10^6 elements: the set / single-pass versions against the previous list-scan / repeated-pop ones, and
+the numpy fast paths.
+    python benchmarks/bench_list_funcs.py --n 1000000
+"""
+import argparse
+import time
+
+from mzutils.list_funcs import pad_list, pop_indices, remove_elements_from_list
+
+
+def old_remove_elements_from_list(lst, elements):
+    return [e for e in lst if e not in elements]
+
+
+def old_pop_indices(lst, indices):
+    for n in sorted(indices, reverse=True):
+        lst.pop(n)
+    return lst
+
+
+def old_pad_list(lst, length, element=''):
+    if len(lst) >= length:
+        return lst[:length]
+    return lst + [element for _ in range(length - len(lst))]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=1000000)
+    parser.add_argument('--old-n', type=int, default=100000,
+                        help='items scanned by the old remove_elements_from_list, its time is scaled to n.')
+    args = parser.parse_args()
+    n, old_n = args.n, args.old_n
+    lst, elements, indices = list(range(n)), list(range(0, n, 1000)), list(range(0, n, 100))
+    old_lst = list(range(old_n))
+
+    print('%-26s %12s %12s' % ('n = %d' % n, 'new s', 'old s'))
+    # removing m = n / 1000 elements: the old scan is O(n * m), scanning old_n of the n items and scaling is exact.
+    print('%-26s %12.3f %12.3f' % ('remove_elements_from_list', timed(remove_elements_from_list, lst, elements),
+                                   timed(old_remove_elements_from_list, old_lst, elements) * n / old_n))
+    # popping k = n / 100 indices: each pop moves O(n) pointers, so the old version is O(n * k).
+    print('%-26s %12.3f %12.3f' % ('pop_indices', timed(pop_indices, list(lst), indices),
+                                   timed(old_pop_indices, list(lst), indices)))
+    print('%-26s %12.3f %12.3f' % ('pad_list', timed(pad_list, [], n), timed(old_pad_list, [], n)))
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    array, array_elements = np.arange(n), np.array(elements)
+    print('%-26s %12.3f' % ('remove_elements (ndarray)', timed(remove_elements_from_list, array, array_elements)))
+    print('%-26s %12.3f' % ('pop_indices (ndarray)', timed(pop_indices, array, indices)))
+    print('%-26s %12.3f' % ('pad_list (ndarray)', timed(pad_list, np.arange(0), n)))
+
+
+if __name__ == '__main__':
+    main()
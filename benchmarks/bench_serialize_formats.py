@@ -0,0 +1,55 @@
+"""
+serialize / deserialize time and file size per format, on representative payloads.
+    python benchmarks/bench_serialize_formats.py --n 1000000
+"""
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+
+from mzutils.serialize_funcs import deserialize, serialize
+
+
+def make_payloads(n):
+    payloads = {
+        'list of str': ['sentence number %d of the corpus' % i for i in range(n)],
+        'dict of numbers': {'key%d' % i: i * 0.5 for i in range(n)},
+        'list of dicts': [{'id': i, 'tokens': ['a', 'b', 'c'], 'score': i / 7} for i in range(n // 10)],
+    }
+    if importlib.util.find_spec('numpy') is not None:
+        import numpy as np
+        payloads['dict of arrays'] = {'embeddings': np.random.rand(n // 100, 128).astype(np.float32),
+                                      'ids': np.arange(n // 100)}
+    return payloads
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=200000)
+    args = parser.parse_args()
+    formats = ['pickle', 'marshal', 'msgpack', 'npz', 'auto']
+    if importlib.util.find_spec('msgpack') is None:
+        formats.remove('msgpack')
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench.pkl')
+    print('%-16s %-8s %10s %10s %10s' % ('payload', 'format', 'dump s', 'load s', 'MB'))
+    for name, payload in make_payloads(args.n).items():
+        for format in formats:
+            start = time.perf_counter()
+            try:
+                serialize(payload, path, compression=None, format=format)
+            except TypeError:  # the format can not represent this payload.
+                continue
+            dump_s = time.perf_counter() - start
+            start = time.perf_counter()
+            deserialize(path, compression=None)
+            load_s = time.perf_counter() - start
+            print('%-16s %-8s %10.3f %10.3f %10.1f' % (name, format, dump_s, load_s,
+                                                     os.path.getsize(path) / (1 << 20)))
+            os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+n single-row appends: append_tsv (reopens the file every call) vs TsvAppender (keeps it open and buffers).
+    python benchmarks/bench_tsv_appender.py --rows 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from mzutils.ctsv_funcs import TsvAppender, append_tsv
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--fsync', default='never', choices=['never', 'flush', 'row'])
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    row = [12345, 'loss', 0.123456]
+    results = {}
+
+    path = os.path.join(directory, 'append_tsv.tsv')
+    start = time.perf_counter()
+    for _ in range(args.rows):
+        append_tsv(path, [row], compression=None)
+    results['append_tsv'] = time.perf_counter() - start
+
+    path = os.path.join(directory, 'tsv_appender.tsv')
+    start = time.perf_counter()
+    with TsvAppender(path, fsync=args.fsync) as appender:
+        for _ in range(args.rows):
+            appender.writerow(row)
+    results['TsvAppender(fsync=%r)' % args.fsync] = time.perf_counter() - start
+
+    for name, elapsed in results.items():
+        print('%-28s %d rows in %8.2fs, %10.0f rows/s' % (name, args.rows, elapsed, args.rows / elapsed))
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,144 @@
-from .control_models import *
-from .ctsv_funcs import *
-from .data_structures import *
-from .gym_space_management import *
-from .json_funcs import *
-from .list_funcs import *
-from .nlp_tasks import *
-from .computing_funcs import *
-from .os_funcs import *
-from .parser import *
-from .probabilities_funcs import *
-from .serialize_funcs import *
-from .string_funcs import *
-from .tf_funcs import *
-from .torch_funcs import *
-from .dataframe_funcs import *
-from .aws_funcs import *
+"""
+submodules are imported lazily on first attribute access, so ``import mzutils`` stays cheap and heavy dependencies
+(torch, torchvision, nltk, sklearn, pandas, numpy) are only loaded by the functions that need them.
+>>> import mzutils
+>>> mzutils.read_tsv  # only imports mzutils.ctsv_funcs
+"""
+import importlib
+
+# submodule -> public names it provides at the top level (what used to be ``from .submodule import *``).
+_lazy_submodules = {
+    'control_models': (
+        'PIDModel',
+    ),
+    'ctsv_funcs': (
+        'write_tsv', 'iter_delimited', 'iter_tsv', 'iter_csv', 'read_tsv', 'append_tsv', 'segment_large_csv',
+        'segment_large_tsv', 'save_tsv_as_csv', 'find_max_sub_list_length', 'beautify_csv_lines_horizontal',
+        'beautify_csv_lines', 'helper_scan_row_ends', 'helper_write_segment', 'helper_parallel_segment_delimited',
+        'TsvIndex', 'TsvAppender', 'read_tsv_columnar', 'partition_delimited_by_key', 'helper_read_header',
+        'helper_count_rows', 'helper_row_offsets', 'helper_partition_rows', 'IRREGULAR_LINE_BREAKS',
+        'helper_iter_row_ends', 'helper_snap_bounds', 'IRREGULAR_LINE_BREAKS_RE',
+    ),
+    'data_structures': (
+        'SimplePriorityQueue', 'SeedData',
+    ),
+    'gym_space_management': (
+        'normalize_spaces', 'denormalize_spaces', 'list_of_str_to_numpy_onehot_dict',
+    ),
+    'json_funcs': (
+        'dump_json', 'load_json', 'JSON_BACKENDS', 'get_json_backend', 'helper_json_dumps', 'helper_json_loads',
+        'iter_jsonl', 'dump_jsonl', 'append_jsonl', 'load_jsonl', 'helper_load_jsonl_range', 'iter_json_items',
+        'helper_has_non_finite', 'helper_numpy_default',
+    ),
+    'list_funcs': (
+        'remove_elements_from_list', 'pop_indices', 'pad_list', 'split_list_with_len', 'flatten', 'ichunks', 'iflatten',
+        'helper_is_ndarray', 'helper_iflatten',
+    ),
+    'nlp_tasks': (
+        'data_preprocessing', 'ner_funcs', 'nlp_metrics',
+    ),
+    'nlp_tasks.data_preprocessing': (
+        'generate_multi_test_cases', 'simple_squad_segmentor', 'retrieve_questions_from_triviaQA',
+        'generate_multi_test_cases_triviaQA', 'concatenate_predictions_dicts', 'iter_questions_from_triviaQA',
+        'helper_triviaQA_question',
+    ),
+    'nlp_tasks.ner_funcs': (
+        'helper_flatten', 'subword_tokenize_labels', 'labels_from_subword_labels',
+        'rejoin_bert_tokenized_sentence',
+    ),
+    'nlp_tasks.nlp_metrics': (
+        'compute_sentence_pseudo_mlm_perplexity', 'rouge_helper_prepare_results', 'remove_sub_strings',
+        'remove_sub_strings_chinese', 'translation_paraphrase_evaluation_english_tagpa',
+        'translation_paraphrase_evaluation', 'translation_paraphrase_evaluation_chinese',
+    ),
+    'computing_funcs': (
+        'argmin_indices', 'argmax_indices', 'argmax', 'argmax_decorator', 'multi_label_cosine_similarity',
+    ),
+    'os_funcs': (
+        'parent_dir_and_name', 'basename_and_extension', 'get_things_in_loc', 'get_checkpoints_in_loc', 'clean_dir',
+        'mkdir_p', 'unzip_all', 'documents_segementor_on_word_length', 'helper_document_segmentor',
+        'helper_save_documents', 'helper_check_existance_and_add_timestamp', 'loop_through_copy_files_to_one_dir',
+        'loop_through_return_abs_file_path', 'loop_through_store_files_to_list', 'loop_through_store_lines_to_list',
+        'save__init__args', 'set_local_vars_from_yaml', 'TimeRecorder', 'infer_compression', 'open_compressed',
+        'COMPRESSION_EXTENSIONS',
+    ),
+    'parser': (
+        'argparse_bool',
+    ),
+    'probabilities_funcs': (
+        'permutation', 'binomial_coefficient', 'vote_for_cluster',
+    ),
+    'serialize_funcs': (
+        'serialize', 'deserialize', 'serialize_file_to_list', 'OUT_OF_BAND_MAGIC', 'OUT_OF_BAND_ALIGNMENT',
+        'SentenceStore', 'write_sentence_store', 'serialize_file_to_sentence_store', 'convert_pickle_to_sentence_store',
+        'disk_memoize', 'helper_cache_entries', 'helper_evict_lru', 'FORMAT_MAGIC', 'SERIALIZE_FORMATS',
+        'helper_pick_format', 'helper_dumps', 'helper_loads', 'helper_is_array_dict', 'helper_is_builtin_data',
+        'helper_canonical_key',
+    ),
+    'string_funcs': (
+        'replace_nth_occur', 'add_spaces_between_special_characters', 'select_first_sentence', 'py_serialize',
+        'py_deserialize', 'str_rep_to_list', 'string_segementor_on_word_length',
+        'chinese_document_segementor_on_word_length', 'chinese_sent_tokenize', 'detag', 'file_detag',
+        'char_in_language', 'string_in_language', 'nltk_english_pos_tags',
+    ),
+    'tf_funcs': (
+        'torchlike_gather',
+    ),
+    'torch_funcs': (
+        'model_params', 'conv2d_select_correct_element', 'conv2d_output_single_shape', 'conv2d_output_shape',
+        'check_tensor_occupied_memory', 'LabelSmoothingLoss', 'DifferentiableClamp', 'differentiable_clamp',
+        'PadCenterCrop', 'ImageExperimentProcessor', 'exact_matches', 'multi_label_predictions',
+        'multi_label_exact_matches', 'top_x_multi_label_exact_matches', 'set_seed',
+    ),
+    'dataframe_funcs': (
+        'parquet_append', 'helper_open_delimited_stream', 'convert_delimited_to_parquet', 'convert_delimited_to_arrow',
+        'AppendableParquetDataset', 'parquet_read', 'helper_iter_batches',
+    ),
+    'aws_funcs': (
+        'hash_compare_two_files', 'get_s3_filesystem', 'file_size_and_etag', 'stream_hash_file', 'HASH_CACHE_PATH',
+        'hash_tree', 'diff_trees', 'helper_load_hash_cache', 'helper_dump_hash_cache', 'tree_hash_file',
+        'diff_tree_hashes', 'helper_hash_range', 'REMOTE_MANIFEST', 'sync_dir_to_s3', 'sync_s3_to_dir',
+        'helper_load_remote_manifest',
+    ),
+}
+
+_lazy_names = {name: submodule for submodule, names in _lazy_submodules.items() for name in names}
+# order of the former ``from .submodule import *`` lines. other public globals of these submodules (e.g. mzutils.np,
+# mzutils.os, mzutils.torch) are still reachable, found by importing them last to first, as the star imports resolved.
+_star_import_order = (
+    'control_models', 'ctsv_funcs', 'data_structures', 'gym_space_management', 'json_funcs', 'list_funcs', 'nlp_tasks',
+    'computing_funcs', 'os_funcs', 'parser', 'probabilities_funcs', 'serialize_funcs', 'string_funcs', 'tf_funcs',
+    'torch_funcs', 'dataframe_funcs', 'aws_funcs',
+)
+__all__ = [name for name in _lazy_submodules if '.' not in name] + list(_lazy_names)
+
+
+def __getattr__(name):
+    if name in _lazy_names:
+        value = getattr(importlib.import_module('.' + _lazy_names[name], __name__), name)
+    elif name in _lazy_submodules:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        value = _getattr_star_imported(name)
+    globals()[name] = value  # cache it, so __getattr__ is only hit once per name.
+    return value
+
+
+def _getattr_star_imported(name):
+    """
+    a public global of a submodule that is not in _lazy_submodules, as the star imports used to re-export it.
+    this imports the submodules (last to first) until one defines name, so it is as slow as the old eager import.
+    """
+    if not name.startswith('_'):
+        for submodule in reversed(_star_import_order):
+            try:
+                module = importlib.import_module('.' + submodule, __name__)
+            except ImportError:  # a missing optional dependency, that submodule can not be what is asked for.
+                continue
+            if name in vars(module):
+                return vars(module)[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names) | {name for name in _lazy_submodules if '.' not in name})
@@ -1,43 +1,333 @@
+import hashlib
 import os
-import hashfile
+import re
+from concurrent.futures import ThreadPoolExecutor
 
+from mzutils.json_funcs import dump_json, helper_json_dumps, helper_json_loads, load_json
 
-def hash_compare_two_files(file_path1, file_path2):
+
+def get_s3_filesystem(**kwargs):
+    """
+    an s3fs.S3FileSystem with the botocore timeouts and retries used across aws_funcs.
+    pass e.g. client_kwargs={'endpoint_url': 'http://127.0.0.1:5000'} to talk to a local S3 stand-in (moto server).
+    """
+    import s3fs
+    config_kwargs = {'read_timeout': 120, 'connect_timeout': 120, 'retries': {'max_attempts': 5, 'mode': 'standard'}}
+    config_kwargs.update(kwargs.pop('config_kwargs', {}))
+    return s3fs.S3FileSystem(config_kwargs=config_kwargs, **kwargs)
+
+
+def file_size_and_etag(file_path, s3=None):
+    """
+    :return: (size, etag) of a local file (etag None) or of an s3 object, without reading its content.
+    """
+    if not file_path.startswith("s3://"):
+        return os.path.getsize(file_path), None
+    info = (s3 or get_s3_filesystem()).info(file_path)
+    etag = info.get('ETag') or info.get('etag')
+    return info['size'], etag.strip('"') if etag else None
+
+
+def stream_hash_file(file_path, algo='sha1', chunk_size=1 << 23, workers=8, s3=None):
+    """
+    hash a local file or an s3 object without downloading it to disk.
+    s3 objects are read as ranged GETs of chunk_size bytes, up to workers of them in flight at once, and fed to the
+    rolling hash in order, so memory stays bounded by workers * chunk_size.
+    :param file_path: local path or s3:// path.
+    :param algo: any hashlib algorithm.
+    :return: hex digest.
+    """
+    hasher = hashlib.new(algo)
+    if not file_path.startswith("s3://"):
+        with open(file_path, 'rb') as fp:
+            for block in iter(lambda: fp.read(chunk_size), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+    s3 = s3 or get_s3_filesystem()
+    size = s3.info(file_path)['size']
+    starts = range(0, size, chunk_size)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for i, start in enumerate(starts):
+            futures[i] = executor.submit(s3.cat_file, file_path, start=start, end=min(start + chunk_size, size))
+            if i >= workers - 1:  # keep at most workers ranges in flight.
+                hasher.update(futures.pop(i - workers + 1).result())
+        for i in sorted(futures):
+            hasher.update(futures[i].result())
+    return hasher.hexdigest()
+
+
+def hash_compare_two_files(file_path1, file_path2, algo='sha1', chunk_size=1 << 23, workers=8, trust_etag=True,
+                           s3=None):
     """check whether the hash of two files are the same.
+    s3 objects are hashed by streaming ranged reads (see stream_hash_file), no temporary download.
+    before reading any bytes, different sizes (or, with trust_etag, different single-part md5 ETags of two s3 objects)
+    already tell the files apart.
 
     Args:
         file_path1 (str): path to file 1, can be s3 path
         file_path2 (str): path to file 2, can be s3 path
-        
+        algo (str): any hashlib algorithm.
+        chunk_size (int): bytes per ranged read.
+        workers (int): ranged reads in flight per s3 object.
+        trust_etag (bool): whether different single-part ETags mean different content. they are the md5 of the
+        content, except for SSE-KMS / SSE-C encrypted objects, for which this should be False.
+        s3 (s3fs.S3FileSystem): None for get_s3_filesystem().
+
     Returns:
-        tuple of bool, f1_hash, f2_hash: 
-        whether the hash of two files are the same, and their hashes respectively.
-    """
-    if file_path1.startswith("s3://") or file_path2.startswith("s3://"):
-        import s3fs
-        import tempfile
-        with tempfile.TemporaryDirectory() as temp1_dir:
-            with tempfile.TemporaryDirectory() as temp2_dir:
-                s3 = s3fs.S3FileSystem()
-                s3.read_timeout=120
-                s3.connect_timeout=120
-                s3.retries={'max_attempts': 5, 'mode': 'standard'}
-                if file_path1.startswith("s3://"):
-                    s3.get(file_path1, temp1_dir, recursive=True)
-                    file1 = os.path.join(temp1_dir, os.path.basename(file_path1))
-                else:
-                    file1 = file_path1
-                    
-                if file_path2.startswith("s3://"):
-                    s3.get(file_path2, temp2_dir, recursive=True)
-                    file2 = os.path.join(temp2_dir, os.path.basename(file_path2))
-                else:
-                    file2 = file_path2
-            
-                f1_hash = hashfile(file1)
-                f2_hash = hashfile(file2)
-    else:
-        f1_hash = hashfile(file1)
-        f2_hash = hashfile(file2)
-    
+        tuple of bool, f1_hash, f2_hash:
+        whether the hash of two files are the same, and their hashes respectively (None if not computed because of
+        a size or ETag mismatch).
+    """
+    if s3 is None and (file_path1.startswith("s3://") or file_path2.startswith("s3://")):
+        s3 = get_s3_filesystem()
+    (size1, etag1), (size2, etag2) = file_size_and_etag(file_path1, s3), file_size_and_etag(file_path2, s3)
+    if size1 != size2:
+        return False, None, None
+    md5_etag = re.compile('^[0-9a-f]{32}$')
+    if trust_etag and etag1 and etag2 and md5_etag.match(etag1) and md5_etag.match(etag2) and etag1 != etag2:
+        return False, None, None
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        f1_hash, f2_hash = executor.map(lambda file_path: stream_hash_file(file_path, algo, chunk_size, workers, s3),
+                                        [file_path1, file_path2])
     return f1_hash == f2_hash, f1_hash, f2_hash
+
+
+HASH_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'mzutils', 'hash_tree_cache.json')
+
+
+def hash_tree(path, workers=8, algo='sha1', cache_path=HASH_CACHE_PATH):
+    """
+    hash every file under a local directory with a thread pool.
+    digests are kept in a persistent json cache keyed on (path, size, mtime, inode), so files that did not change
+    since the last call are never reread.
+    :param path: local directory.
+    :param workers: files hashed concurrently.
+    :param algo: any hashlib algorithm.
+    :param cache_path: json file holding the cache, None to disable it.
+    :return: {relative path ('/' separated): hex digest}
+    """
+    if not os.path.isdir(path):  # os.walk would silently yield nothing, i.e. an empty tree.
+        raise NotADirectoryError("%s is not a directory." % path)
+    root = os.path.abspath(path)
+    stats = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            if cache_path is not None and file_path == os.path.abspath(cache_path):
+                continue
+            st = os.stat(file_path)
+            stats[file_path] = [st.st_size, st.st_mtime_ns, st.st_ino]
+    entries = helper_load_hash_cache(cache_path)
+    digests, to_hash = {}, []
+    for file_path, key in stats.items():
+        cached = entries.get(algo + ':' + file_path)
+        if cached is not None and cached[:3] == key:
+            digests[file_path] = cached[3]
+        else:
+            to_hash.append(file_path)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        digests.update(zip(to_hash, executor.map(lambda file_path: stream_hash_file(file_path, algo), to_hash)))
+    if cache_path is not None:
+        prefix = algo + ':' + os.path.join(root, '')
+        entries = {k: v for k, v in entries.items() if not k.startswith(prefix)}  # drop files deleted since.
+        entries.update({algo + ':' + file_path: stats[file_path] + [digests[file_path]] for file_path in stats})
+        helper_dump_hash_cache(entries, cache_path)
+    return {os.path.relpath(file_path, root).replace(os.sep, '/'): digest for file_path, digest in
+            sorted(digests.items())}
+
+
+def diff_trees(a, b, workers=8, algo='sha1', cache_path=HASH_CACHE_PATH):
+    """
+    compare two local directories by content, see hash_tree.
+    :return: manifest {'added': [...], 'removed': [...], 'changed': [...]} of relative paths, added being in b only and
+    removed in a only.
+    """
+    hashes_a = hash_tree(a, workers, algo, cache_path)
+    hashes_b = hash_tree(b, workers, algo, cache_path)
+    return {
+        'added': sorted(hashes_b.keys() - hashes_a.keys()),
+        'removed': sorted(hashes_a.keys() - hashes_b.keys()),
+        'changed': sorted(k for k in hashes_a.keys() & hashes_b.keys() if hashes_a[k] != hashes_b[k]),
+    }
+
+
+def tree_hash_file(file_path, chunk_size=1 << 26, workers=8, algo='sha1', manifest_path=None, block_size=1 << 22):
+    """
+    tree-hash a large local file: fixed-size chunks are hashed concurrently by a thread pool reading with os.pread
+    (both pread and hashlib release the GIL), and the root digest is the hash of the concatenated chunk digests.
+    the root therefore differs from a plain hash of the file; compare it only with other tree_hash_file roots made with
+    the same algo and chunk_size.
+    :param chunk_size: bytes per chunk, the granularity at which diff_tree_hashes reports differences.
+    :param workers: chunks hashed concurrently.
+    :param algo: any hashlib algorithm.
+    :param manifest_path: if given, the manifest is also written there as json.
+    :param block_size: bytes per pread inside a chunk, memory stays bounded by workers * block_size.
+    :return: manifest {'algo', 'chunk_size', 'size', 'chunks': [hex digest per chunk], 'root': hex digest}
+    """
+    size = os.path.getsize(file_path)
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(
+                lambda start: helper_hash_range(fd, start, min(start + chunk_size, size), algo, block_size),
+                range(0, size, chunk_size)))
+    finally:
+        os.close(fd)
+    root = hashlib.new(algo)
+    for chunk in chunks:
+        root.update(bytes.fromhex(chunk))
+    manifest = {'algo': algo, 'chunk_size': chunk_size, 'size': size, 'chunks': chunks, 'root': root.hexdigest()}
+    if manifest_path is not None:
+        dump_json(manifest, manifest_path)
+    return manifest
+
+
+def diff_tree_hashes(manifest1, manifest2):
+    """
+    byte ranges in which two files differ, from their tree_hash_file manifests.
+    :param manifest1: manifest dict, or path to a json manifest written by tree_hash_file.
+    :param manifest2: same as manifest1.
+    :return: list of merged [start, end) byte ranges, with offsets past the shorter file counted as different.
+    """
+    manifest1 = load_json(manifest1) if isinstance(manifest1, str) else manifest1
+    manifest2 = load_json(manifest2) if isinstance(manifest2, str) else manifest2
+    if (manifest1['algo'], manifest1['chunk_size']) != (manifest2['algo'], manifest2['chunk_size']):
+        raise ValueError("manifests use different algo or chunk_size, rehash one of the files.")
+    chunk_size = manifest1['chunk_size']
+    end = max(manifest1['size'], manifest2['size'])
+    chunks1, chunks2 = manifest1['chunks'], manifest2['chunks']
+    ranges = []
+    for i in range(max(len(chunks1), len(chunks2))):
+        if i < len(chunks1) and i < len(chunks2) and chunks1[i] == chunks2[i]:
+            continue
+        start = i * chunk_size
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = min(start + chunk_size, end)
+        else:
+            ranges.append([start, min(start + chunk_size, end)])
+    return ranges
+
+
+REMOTE_MANIFEST = '_mzutils_manifest.json'
+
+
+def sync_dir_to_s3(local, s3_uri, workers=8, algo='sha1', delete=False, part_size=1 << 26, part_workers=4,
+                   cache_path=HASH_CACHE_PATH, s3=None):
+    """
+    upload only the files of a local directory whose content hash differs from the remote manifest
+    (s3_uri/REMOTE_MANIFEST, {relative path: digest} written by the previous sync).
+    workers files are sent at once through one s3fs client, so connections are reused; files larger than 2 * part_size
+    go as multipart uploads with part_workers parts in flight. the manifest is rewritten last, so an interrupted sync
+    only re-sends files on the next call. objects changed on s3 behind the manifest's back are not noticed.
+    :param local: local directory, NotADirectoryError is raised if it does not exist (before anything is deleted).
+    :param s3_uri: s3:// prefix standing for the directory.
+    :param workers: files transferred concurrently, also used for hash_tree.
+    :param algo: any hashlib algorithm, see hash_tree.
+    :param delete: also delete remote objects under s3_uri that are not in the local directory.
+    :param s3: s3fs.S3FileSystem, None for get_s3_filesystem() with a connection pool sized for the transfers.
+    :return: {'uploaded': [...], 'deleted': [...]} relative paths.
+    """
+    s3_uri = s3_uri.rstrip('/')
+    s3 = s3 or get_s3_filesystem(config_kwargs={'max_pool_connections': max(10, workers * part_workers)})
+    local_hashes = hash_tree(local, workers, algo, cache_path)
+    remote_hashes = helper_load_remote_manifest(s3, s3_uri, algo)
+    uploaded = [path for path, digest in local_hashes.items() if remote_hashes.get(path) != digest]
+    if uploaded:
+        s3.put([os.path.join(local, *path.split('/')) for path in uploaded],
+               [s3_uri + '/' + path for path in uploaded],
+               batch_size=workers, chunksize=part_size, max_concurrency=part_workers)
+    deleted = []
+    if delete:
+        prefix = s3_uri[len('s3://'):] + '/'
+        deleted = sorted(key[len(prefix):] for key in s3.find(s3_uri) if key.startswith(prefix) and
+                         key[len(prefix):] not in local_hashes and key[len(prefix):] != REMOTE_MANIFEST)
+        if deleted:
+            s3.rm([s3_uri + '/' + path for path in deleted])
+    s3.pipe_file(s3_uri + '/' + REMOTE_MANIFEST, helper_json_dumps({'algo': algo, 'files': local_hashes}))
+    return {'uploaded': uploaded, 'deleted': deleted}
+
+
+def sync_s3_to_dir(s3_uri, local, workers=8, algo='sha1', delete=False, part_size=1 << 26, part_workers=4,
+                   cache_path=HASH_CACHE_PATH, s3=None):
+    """
+    the download side of sync_dir_to_s3: fetch only the files listed in the remote manifest whose hash differs from the
+    local copy. without a manifest (or with one made with another algo) every object under s3_uri is fetched.
+    :param delete: also delete local files that are not on s3.
+    :return: {'downloaded': [...], 'deleted': [...]} relative paths.
+    for the other params see sync_dir_to_s3.
+    """
+    s3_uri = s3_uri.rstrip('/')
+    s3 = s3 or get_s3_filesystem(config_kwargs={'max_pool_connections': max(10, workers * part_workers)})
+    os.makedirs(local, exist_ok=True)
+    local_hashes = hash_tree(local, workers, algo, cache_path)
+    remote_hashes = helper_load_remote_manifest(s3, s3_uri, algo)
+    if remote_hashes:
+        downloaded = [path for path, digest in remote_hashes.items() if local_hashes.get(path) != digest]
+        remote_paths = set(remote_hashes)
+    else:
+        prefix = s3_uri[len('s3://'):] + '/'
+        remote_paths = {key[len(prefix):] for key in s3.find(s3_uri) if key.startswith(prefix)} - {REMOTE_MANIFEST}
+        downloaded = sorted(remote_paths)
+    if downloaded:
+        local_paths = [os.path.join(local, *path.split('/')) for path in downloaded]
+        for local_path in local_paths:
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        s3.get([s3_uri + '/' + path for path in downloaded], local_paths,
+               batch_size=workers, chunksize=part_size, max_concurrency=part_workers)
+    deleted = []
+    if delete:
+        deleted = sorted(set(local_hashes) - remote_paths)
+        for path in deleted:
+            os.remove(os.path.join(local, *path.split('/')))
+    return {'downloaded': downloaded, 'deleted': deleted}
+
+
+# ------------------helper funcs-----------------------------
+
+
+def helper_load_hash_cache(cache_path):
+    """
+    :return: {algo:absolute path: [size, mtime_ns, inode, digest]}, empty if the cache is missing or unreadable.
+    """
+    if cache_path is None or not os.path.isfile(cache_path):
+        return {}
+    try:
+        return load_json(cache_path, compression=None)
+    except ValueError:
+        return {}
+
+
+def helper_dump_hash_cache(entries, cache_path):
+    """
+    atomically replace the cache file, so a concurrent reader never sees half of it.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+    dump_json(entries, tmp_path, compression=None)
+    os.replace(tmp_path, cache_path)
+
+
+def helper_hash_range(fd, start, end, algo, block_size):
+    """
+    :return: hex digest of bytes [start, end) of an open file descriptor, read with os.pread.
+    """
+    hasher = hashlib.new(algo)
+    while start < end:
+        block = os.pread(fd, min(block_size, end - start), start)
+        if not block:
+            raise EOFError("file shrank while being hashed.")
+        hasher.update(block)
+        start += len(block)
+    return hasher.hexdigest()
+
+
+def helper_load_remote_manifest(s3, s3_uri, algo):
+    """
+    :return: {relative path: digest} from s3_uri/REMOTE_MANIFEST, empty if it is missing or made with another algo.
+    """
+    try:
+        manifest = helper_json_loads(s3.cat_file(s3_uri + '/' + REMOTE_MANIFEST))
+    except FileNotFoundError:
+        return {}
+    return manifest['files'] if manifest.get('algo') == algo else {}
@@ -1,19 +1,38 @@
+import array
 import codecs
 import csv
+import io
+import mmap
 import os
+import random
+import re
+import shutil
 import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 
 import mzutils.list_funcs
+from mzutils.os_funcs import open_compressed
 
 
-def write_tsv(file_path, rows):
+# what str.splitlines (hence codecs.open readers) ends lines at besides b'\n' and b'\r\n', utf-8 encoded.
+# a bare b'\r' (not followed by b'\n') is one too.
+IRREGULAR_LINE_BREAKS = (b'\x0b', b'\x0c', b'\x1c', b'\x1d', b'\x1e', b'\xc2\x85', b'\xe2\x80\xa8', b'\xe2\x80\xa9')
+IRREGULAR_LINE_BREAKS_RE = re.compile(b'|'.join([re.escape(line_break) for line_break in IRREGULAR_LINE_BREAKS] +
+                                                [b'\\r(?!\\n)']))
+
+
+def write_tsv(file_path, rows, compression='infer'):
     """
     :param file_path:
     :param rows: a list of rows to be written in the tsv file. The rows are lists of items.
+    :param compression: see mzutils.os_funcs.open_compressed, e.g. 'infer' writes a.tsv.gz through gzip.
     :return:
     """
     csv.field_size_limit(sys.maxsize)
-    with codecs.open(file_path, "w+", encoding="utf-8") as fp:
+    with open_compressed(file_path, "w+", compression, encoding="utf-8") as fp:
         tsv_writer = csv.writer(fp, delimiter='\t')
         for row in rows:
             tsv_writer.writerow(row)
@@ -21,35 +40,267 @@ def write_tsv(file_path, rows):
             # tsv_writer.writerow(["0", sentence1, sentence2])
 
 
-def read_tsv(file_path):
+def iter_delimited(file_path, delimiter=',', batch_size=None, skip_header=False, columns=None, compression='infer'):
     """
-    read a tsv into a nested python list.
+    lazily read a delimited file row by row, so memory stays constant for any file size.
     :param file_path:
-    :return:
+    :param delimiter: '\t' for tsv, ',' for csv.
+    :param batch_size: None to yield single rows, or an int to yield lists of (at most) batch_size rows.
+    :param skip_header: whether to skip the first row.
+    :param columns: None for all columns, or a list of column indices to keep (in that order).
+    :param compression: see mzutils.os_funcs.open_compressed, e.g. 'infer' reads a.tsv.gz through gzip.
+    :return: a generator of rows (or of batches of rows).
     """
     csv.field_size_limit(sys.maxsize)
-    cached_list = []
-    with codecs.open(file_path, "r", encoding="utf-8") as fp:
-        tsv_reader = csv.reader(fp, delimiter='\t')
-        for row in tsv_reader:
-            cached_list.append(row)
-    return cached_list
+    with open_compressed(file_path, "r", compression, encoding="utf-8") as fp:
+        reader = csv.reader(fp, delimiter=delimiter)
+        if skip_header:
+            next(reader, None)
+        if columns is not None:
+            reader = ([row[i] for i in columns] for row in reader)
+        if batch_size is None:
+            yield from reader
+            return
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def iter_tsv(file_path, batch_size=None, skip_header=False, columns=None, compression='infer'):
+    """
+    lazily read a tsv row by row (or batch_size rows at a time). see iter_delimited.
+    >>> for row in iter_tsv('a.tsv', skip_header=True, columns=[0, 2]):
+    ...     pass
+    """
+    return iter_delimited(file_path, '\t', batch_size=batch_size, skip_header=skip_header, columns=columns,
+                          compression=compression)
 
 
-def append_tsv(file_path, rows):
+def iter_csv(file_path, batch_size=None, skip_header=False, columns=None, compression='infer'):
+    """
+    lazily read a csv row by row (or batch_size rows at a time). see iter_delimited.
+    """
+    return iter_delimited(file_path, ',', batch_size=batch_size, skip_header=skip_header, columns=columns,
+                          compression=compression)
+
+
+def read_tsv(file_path, compression='infer'):
+    """
+    read a tsv into a nested python list. use iter_tsv for files that do not fit in memory.
+    :param file_path:
+    :param compression: see mzutils.os_funcs.open_compressed, e.g. 'infer' reads a.tsv.gz through gzip.
+    :return:
+    """
+    return list(iter_tsv(file_path, compression=compression))
+
+
+def read_tsv_columnar(file_path, dtypes=None, delimiter='\t', output='numpy', sample_bytes=1 << 20, block_size=1 << 24):
+    """
+    read a tsv/csv with a header row into typed columns instead of a list of lists of str.
+    column types are inferred from the first sample_bytes of the file (or given in dtypes), string columns are
+    dictionary-encoded, and the file is parsed in block_size batches. if a later value does not fit an inferred type,
+    that column is widened (integer -> float64 -> string, anything else -> string) and the file is parsed again.
+    peak memory stays close to the size of the typed columns plus the largest column.
+    .gz/.bz2/.zst files are decompressed on the fly by pyarrow.
+    >>> columns = read_tsv_columnar('a.tsv', dtypes={'score': 'float32'})
+    >>> columns['score']  # np.ndarray
+    >>> codes, categories = columns['name']  # string columns, categories[codes] decodes them.
+    :param file_path:
+    :param dtypes: None, or a dict of column name -> numpy dtype, pyarrow.DataType, or 'str' for a string column.
+    a value that does not fit a given dtype raises ValueError naming the column and row.
+    :param delimiter: '\t' for tsv, ',' for csv.
+    :param output: 'numpy' for a dict of column name -> np.ndarray ((codes, categories) for string columns),
+    or 'arrow' for a pyarrow.Table with dictionary<int32, string> columns.
+    :param sample_bytes: how many bytes are parsed to infer the column types.
+    :param block_size: bytes parsed per batch.
+    :return:
+    """
+    import re
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.csv
+    from mzutils.dataframe_funcs import helper_open_delimited_stream
+    dtypes = {} if dtypes is None else dtypes
+    sample = pyarrow.csv.open_csv(file_path, read_options=pyarrow.csv.ReadOptions(block_size=sample_bytes),
+                                  parse_options=pyarrow.csv.ParseOptions(delimiter=delimiter, newlines_in_values=True))
+    fields = []
+    for field in sample.schema:
+        dtype = dtypes.get(field.name, field.type)
+        if dtype in ('str', str) or (isinstance(dtype, pa.DataType) and (pa.types.is_string(dtype) or
+                                                                         pa.types.is_null(dtype))):
+            dtype = pa.dictionary(pa.int32(), pa.string())
+        elif not isinstance(dtype, pa.DataType):
+            dtype = pa.from_numpy_dtype(np.dtype(dtype))
+        fields.append(pa.field(field.name, dtype))
+    sample.close()
+    while True:
+        schema = pa.schema(fields)
+        try:
+            reader = helper_open_delimited_stream(file_path, delimiter, schema, block_size)
+            table = pa.Table.from_batches(reader, schema=schema).unify_dictionaries()
+            break
+        except pa.ArrowInvalid as e:
+            match = re.search(r'CSV column #(\d+)', str(e))
+            if match is None:
+                raise
+            i = int(match.group(1))
+            if fields[i].name in dtypes or pa.types.is_dictionary(fields[i].type):
+                raise ValueError("column %r does not fit its type: %s" % (fields[i].name, e)) from e
+            widened = pa.float64() if pa.types.is_integer(fields[i].type) else pa.dictionary(pa.int32(), pa.string())
+            fields[i] = pa.field(fields[i].name, widened)
+    if output == 'arrow':
+        return table
+    chunks = {name: column.chunks for name, column in zip(table.column_names, table.columns)}
+    n_rows = table.num_rows
+    del table
+    columns = {}
+    for field in fields:
+        # fill a preallocated array chunk by chunk (instead of combine_chunks, which copies every column) and drop
+        # the arrow chunks of the column right after.
+        column = chunks.pop(field.name)
+        if pa.types.is_dictionary(field.type):
+            dictionary = column[0].dictionary if column else pa.array([], pa.string())
+            values = [chunk.indices for chunk in column]
+            value_type = pa.int32()
+        else:
+            values = column
+            value_type = field.type
+        if any(chunk.null_count for chunk in values):  # the numpy dtype then depends on the values.
+            array = pa.chunked_array(values, value_type).to_numpy()
+        else:
+            array = np.empty(n_rows, dtype=value_type.to_pandas_dtype())
+            offset = 0
+            for chunk in values:
+                array[offset:offset + len(chunk)] = chunk.to_numpy(zero_copy_only=False)
+                offset += len(chunk)
+        del column, values
+        if pa.types.is_dictionary(field.type):
+            columns[field.name] = (array, dictionary.to_numpy(zero_copy_only=False))
+        else:
+            columns[field.name] = array
+    return columns
+
+
+def append_tsv(file_path, rows, compression='infer'):
     """
     :param file_path:
     :param rows: a list of rows to be written in the tsv file. The rows are lists of items.
+    :param compression: see mzutils.os_funcs.open_compressed. compressed files get a new compressed frame appended.
     :return:
+    when appending a few rows at a time in a loop, use TsvAppender, which keeps the file open instead.
     """
     csv.field_size_limit(sys.maxsize)
-    with codecs.open(file_path, "a+", encoding="utf-8") as fp:
+    with open_compressed(file_path, "a+", compression, encoding="utf-8") as fp:
         tsv_writer = csv.writer(fp, delimiter='\t')
         for row in rows:
             tsv_writer.writerow(row)
 
 
-def segment_large_csv(file_path, destination_path, segmentation_length, duplicate_header=False):
+class TsvAppender:
+    """
+    keep a tsv/csv open for appending and buffer the rows, instead of reopening the file on every append_tsv.
+    the buffer is written out once it holds max_buffer_bytes bytes or max_buffer_rows rows, when flush_interval
+    seconds have passed since the last flush (by a background thread, so rows reach the disk even if the writes stall),
+    and on close. the appender is thread-safe. compressed files (e.g. log.tsv.gz) get one more compressed member or
+    frame per appender, which the readers of mzutils.os_funcs.open_compressed read back as one stream.
+    >>> with TsvAppender('log.tsv', max_buffer_rows=1000, flush_interval=5) as appender:
+    ...     for step in range(10000):
+    ...         appender.writerow([step, 'loss', 0.1])
+    """
+
+    def __init__(self, file_path, delimiter='\t', max_buffer_bytes=1 << 20, max_buffer_rows=None, flush_interval=None,
+                 fsync='never', compression='infer'):
+        """
+        :param file_path:
+        :param delimiter: '\t' for tsv, ',' for csv.
+        :param max_buffer_bytes: None or the buffer size (utf-8 encoded) that triggers a flush.
+        :param max_buffer_rows: None or the number of buffered rows that triggers a flush.
+        :param flush_interval: None or seconds after which a background thread flushes the buffer.
+        :param fsync: 'never', 'flush' to os.fsync after every flush, or 'row' to flush and os.fsync after every row.
+        :param compression: see mzutils.os_funcs.open_compressed, 'infer' picks the codec from the extension.
+        """
+        if fsync not in ('never', 'flush', 'row'):
+            raise ValueError("fsync should be one of 'never', 'flush' or 'row'.")
+        self.file_path = file_path
+        self.max_buffer_bytes = max_buffer_bytes
+        self.max_buffer_rows = max_buffer_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.buffer = bytearray()
+        self.buffered_rows = 0
+        self.last_flush = time.monotonic()
+        self.writer = csv.writer(self, delimiter=delimiter)
+        self.fp = open_compressed(file_path, 'ab', compression)
+        self.lock = threading.RLock()
+        self.closing = threading.Event()
+        self.flusher = None
+        if flush_interval is not None:
+            self.flusher = threading.Thread(target=self.flush_periodically, daemon=True)
+            self.flusher.start()
+
+    def write(self, s):
+        """
+        called by the csv writer, encodes s into the buffer.
+        """
+        self.buffer += s.encode('utf-8')
+
+    def writerow(self, row):
+        with self.lock:
+            if self.closing.is_set():
+                raise ValueError("writerow on a closed TsvAppender: " + str(self.file_path))
+            self.writer.writerow(row)
+            self.buffered_rows += 1
+            if self.fsync == 'row' \
+                    or (self.max_buffer_bytes is not None and len(self.buffer) >= self.max_buffer_bytes) \
+                    or (self.max_buffer_rows is not None and self.buffered_rows >= self.max_buffer_rows):
+                self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                self.fp.write(self.buffer)
+                self.buffer.clear()
+            self.buffered_rows = 0
+            self.fp.flush()
+            if self.fsync != 'never':
+                os.fsync(self.fp.fileno())
+            self.last_flush = time.monotonic()
+
+    def flush_periodically(self):
+        """
+        body of the background thread: flush whenever flush_interval seconds passed since the last flush, until close.
+        """
+        while not self.closing.wait(max(0.0, self.last_flush + self.flush_interval - time.monotonic())):
+            with self.lock:
+                if not self.fp.closed and time.monotonic() - self.last_flush >= self.flush_interval:
+                    self.flush()
+
+    def close(self):
+        self.closing.set()
+        if self.flusher is not None and self.flusher is not threading.current_thread():
+            self.flusher.join()
+        with self.lock:
+            if not self.fp.closed:
+                self.flush()
+                self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def segment_large_csv(file_path, destination_path, segmentation_length, duplicate_header=False, workers=None):
     """
     segment a large file to several smaller files to a destination.
     If duplicate_header is True, the first line of  the original large file will be duplicated to every segmented files,
@@ -58,8 +309,15 @@ def segment_large_csv(file_path, destination_path, segmentation_length, duplicat
     :param destination_path:
     :param segmentation_length:
     :param duplicate_header:
+    :param workers: if > 1, split the file at row boundaries by byte offsets and write the segments in a process pool.
+    the segmented files are byte-identical to the serial ones. see helper_parallel_segment_delimited.
     :return: how many files are segmented.
     """
+    if workers is not None and workers > 1:
+        j = helper_parallel_segment_delimited(file_path, destination_path, segmentation_length, duplicate_header,
+                                              ',', workers)
+        if j is not None:
+            return j
     csv.field_size_limit(sys.maxsize)
     filename, file_extension = os.path.splitext(os.path.basename(file_path))
     header = None
@@ -86,7 +344,7 @@ def segment_large_csv(file_path, destination_path, segmentation_length, duplicat
                         return j
 
 
-def segment_large_tsv(file_path, destination_path, segmentation_length, duplicate_header=False):
+def segment_large_tsv(file_path, destination_path, segmentation_length, duplicate_header=False, workers=None):
     """
     segment a large file to several smaller files to a destination.
     If duplicate_header is True, the first line of  the original large file will be duplicated to every segmented files,
@@ -95,8 +353,15 @@ def segment_large_tsv(file_path, destination_path, segmentation_length, duplicat
     :param destination_path:
     :param segmentation_length:
     :param duplicate_header:
+    :param workers: if > 1, split the file at row boundaries by byte offsets and write the segments in a process pool.
+    the segmented files are byte-identical to the serial ones. see helper_parallel_segment_delimited.
     :return: how many files are segmented.
     """
+    if workers is not None and workers > 1:
+        j = helper_parallel_segment_delimited(file_path, destination_path, segmentation_length, duplicate_header,
+                                              '\t', workers)
+        if j is not None:
+            return j
     csv.field_size_limit(sys.maxsize)
     filename, file_extension = os.path.splitext(os.path.basename(file_path))
     header = None
@@ -123,6 +388,72 @@ def segment_large_tsv(file_path, destination_path, segmentation_length, duplicat
                         return j
 
 
+def partition_delimited_by_key(file_path, destination_path, key_col, n_partitions, delimiter=None,
+                               duplicate_header=False, buffer_bytes=1 << 20, workers=None):
+    """
+    hash-partition a large tsv/csv by a key column, so that all rows of the same key end up in the same file.
+    the partition of a key is zlib.crc32(key.encode('utf-8')) % n_partitions, which is stable across processes and
+    runs. the input is streamed once and every partition is written through its own TsvAppender, so memory stays
+    bounded by n_partitions * buffer_bytes. partition i is written to destination_path/filename + str(i) + extension.
+    :param file_path:
+    :param destination_path:
+    :param key_col: index of the key column, or its name if duplicate_header.
+    :param n_partitions:
+    :param delimiter: None to pick '\t' for .tsv files and ',' otherwise.
+    :param duplicate_header: whether the first row is a header, which is then duplicated to every partition.
+    :param buffer_bytes: write buffer size of each partition.
+    :param workers: if > 1, pre-split the file into row ranges that are partitioned in a process pool. every worker
+    writes its own part files, which are concatenated in order, so the partitions are the same as the serial ones.
+    :return: list of the partition file paths.
+    """
+    filename, file_extension = os.path.splitext(os.path.basename(file_path))
+    if delimiter is None:
+        delimiter = '\t' if file_extension.lower() == '.tsv' else ','
+    header = None
+    data_start = 0
+    if duplicate_header:
+        header, data_start = helper_read_header(file_path, delimiter)
+    key_index = header.index(key_col) if isinstance(key_col, str) else key_col
+    output_paths = [os.path.join(destination_path, filename + str(i) + file_extension) for i in range(n_partitions)]
+
+    def init_outputs():
+        for output_path in output_paths:
+            with TsvAppender(output_path, delimiter, compression=None) as appender:
+                appender.fp.truncate(0)
+                if header is not None:
+                    appender.writerow(header)
+
+    init_outputs()
+    if workers is not None and workers > 1 and os.path.getsize(file_path) > data_start:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counted_rows = helper_count_rows(file_path, data_start, executor, workers * 4, delimiter)
+            if counted_rows is not None:
+                n_total = counted_rows[-1]
+                per_task = max(1, -(-n_total // (workers * 4)))
+                row_indices = list(range(0, n_total, per_task))
+                starts = helper_row_offsets(file_path, counted_rows, row_indices, executor, delimiter)
+                futures = []
+                for k, (row, start) in enumerate(zip(row_indices, starts)):
+                    part_paths = [output_path + '.part' + str(k) for output_path in output_paths]
+                    n_rows = min(per_task, n_total - row)
+                    futures.append((n_rows, part_paths, executor.submit(
+                        helper_partition_rows, file_path, start, n_rows, delimiter, key_index, part_paths,
+                        buffer_bytes)))
+                consistent = all(future.result() == n_rows for n_rows, _, future in futures)
+                for i, output_path in enumerate(output_paths):
+                    with open(output_path, 'ab') as fp:
+                        for _, part_paths, _ in futures:
+                            if consistent:
+                                with open(part_paths[i], 'rb') as part_fp:
+                                    shutil.copyfileobj(part_fp, fp)
+                            os.remove(part_paths[i])
+                if consistent:
+                    return output_paths
+        init_outputs()  # the file is not quoted consistently, fall back to the serial path.
+    helper_partition_rows(file_path, data_start, None, delimiter, key_index, output_paths, buffer_bytes)
+    return output_paths
+
+
 def save_tsv_as_csv(tsv_file, csv_file=None):
     csv.field_size_limit(sys.maxsize)
     from mzutils.os_funcs import parent_dir_and_name, basename_and_extension
@@ -173,3 +504,376 @@ def beautify_csv_lines(lst: list):
     for i in range(len(lst[0])):
         curr_lst.append([lst[j][i] for j in range(len(lst))])
     return curr_lst
+
+
+class TsvIndex:
+    """
+    random access into a large tsv/csv through a sidecar index of row byte offsets.
+    the index is built in one pass and stored as a numpy array in file_path + '.idx', which holds
+    [file size, file mtime_ns, offset of row 0, ..., offset of row n - 1, file size].
+    it is rebuilt automatically if the size or mtime of the file no longer match (stale index).
+    rows are parsed on demand from a mmap of the file, so indexing and slicing cost O(rows returned).
+    >>> index = TsvIndex('a.tsv')
+    >>> len(index), index[0], index[-1], index[10:20], index.sample(5)
+    """
+
+    def __init__(self, file_path, delimiter='\t', index_path=None, rebuild=False):
+        """
+        :param file_path:
+        :param delimiter: '\t' for tsv, ',' for csv.
+        :param index_path: where to store the index, default file_path + '.idx'.
+        :param rebuild: force rebuilding the index.
+        """
+        import numpy as np
+        self.file_path = file_path
+        self.delimiter = delimiter
+        self.index_path = index_path if index_path is not None else file_path + '.idx'
+        stat = os.stat(file_path)
+        index = None
+        if not rebuild and os.path.isfile(self.index_path):
+            index = np.load(self.index_path, mmap_mode='r')
+            if len(index) < 3 or index[0] != stat.st_size or index[1] != stat.st_mtime_ns:
+                index = None
+        if index is None:
+            self.build(stat)
+            index = np.load(self.index_path, mmap_mode='r')
+        self.offsets = index[2:]
+        self.fp = open(file_path, 'rb')
+        self.mm = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size > 0 else b''
+
+    def build(self, stat=None):
+        """
+        scan the file once and write the index (to a temporary file first, then rename it over index_path).
+        row ends are b'\n' outside quoted fields, see helper_iter_row_ends. the other str.splitlines boundaries
+        (IRREGULAR_LINE_BREAKS) stay inside their field, as in csv.reader(open(file_path, newline='')).
+        :raise ValueError: if the file ends rows with a bare b'\r', which the index can not locate.
+        """
+        import numpy as np
+        if stat is None:
+            stat = os.stat(self.file_path)
+        offsets = array.array('Q', [stat.st_size, stat.st_mtime_ns, 0])
+        if stat.st_size > 0:
+            with open(self.file_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                offsets.extend(helper_iter_row_ends(mm, 0, stat.st_size, self.delimiter))
+                if offsets[-1] != stat.st_size:
+                    offsets.append(stat.st_size)  # the last row has no trailing newline.
+                if re.search(b'\r(?!\n)', mm) is not None:
+                    # only a bare b'\r' outside quoted fields ends a row, then the row counts differ.
+                    csv.field_size_limit(sys.maxsize)
+                    text = io.StringIO(mm[:].decode('utf-8'), newline='')
+                    if sum(1 for _ in csv.reader(text, delimiter=self.delimiter)) != len(offsets) - 3:
+                        raise ValueError("TsvIndex does not support rows ended by a bare '\\r': " + self.file_path)
+        tmp_path = self.index_path + '.tmp' + str(os.getpid())
+        with open(tmp_path, 'wb') as fp:
+            np.save(fp, np.frombuffer(offsets, dtype=np.uint64))
+        os.replace(tmp_path, self.index_path)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def parse(self, start, end):
+        """
+        parse the rows stored in bytes [start, end) of the file.
+        """
+        csv.field_size_limit(sys.maxsize)
+        text = io.StringIO(self.mm[start:end].decode('utf-8'), newline='')
+        return list(csv.reader(text, delimiter=self.delimiter))
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if start >= stop:
+                return []
+            return self.parse(int(self.offsets[start]), int(self.offsets[stop]))
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("TsvIndex index out of range")
+        return self.parse(int(self.offsets[item]), int(self.offsets[item + 1]))[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def sample(self, k, seed=None):
+        """
+        k distinct rows picked uniformly at random.
+        """
+        return [self[i] for i in random.Random(seed).sample(range(len(self)), k)]
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# ------------------helper funcs-----------------------------
+
+
+def helper_iter_row_ends(mm, start, end, delimiter, in_quotes=False):
+    """
+    yield the byte offsets right after the row ends (b'\n' outside quoted fields) in mm[start:end], following
+    csv.reader's quoting rules: only a b'"' at the start of a field opens a quoted field (a b'"' elsewhere, e.g. 5" screen,
+    is a plain character), b'""' inside it is an escaped quote, and the next lone b'"' closes it.
+    :param mm: a mmap (or bytes) of the whole file.
+    :param start: a row start if not in_quotes; otherwise a position inside a quoted field right after a b'\n'.
+    :param end: right after a b'\n', or the file size, so that no state straddles it.
+    :param delimiter: single character delimiter.
+    :return: (generator return value) whether end is inside a quoted field.
+    """
+    separators = (ord(delimiter), ord('\n'))
+    p = start
+    while p < end:
+        if in_quotes:
+            q = mm.find(b'"', p, end)
+            if q == -1:
+                return True
+            if q + 1 < end and mm[q + 1] == ord('"'):  # escaped quote.
+                p = q + 2
+                continue
+            # the closing quote. the field goes on unquoted until the next delimiter or row end, as in csv.reader.
+            in_quotes = False
+            p = q + 1
+            continue
+        # unquoted: every b'\n' before the next b'"' ends a row, and that b'"' opens a quoted field iff it starts one.
+        q = mm.find(b'"', p, end)
+        stop = end if q == -1 else q
+        nl = mm.find(b'\n', p, stop)
+        while nl != -1:
+            yield nl + 1
+            nl = mm.find(b'\n', nl + 1, stop)
+        if q == -1:
+            return False
+        in_quotes = q == start or mm[q - 1] in separators
+        p = q + 1
+    return in_quotes
+
+
+def helper_scan_row_ends(file_path, start, end, start_in_quotes=False, targets=None, delimiter='\t'):
+    """
+    scan the bytes [start, end) of a delimited file for row ends, see helper_iter_row_ends.
+    start and end have to be right after a b'\n' (or the file start / end), see helper_snap_bounds.
+    the serial readers (codecs.open) also end lines at the other str.splitlines boundaries, see
+    IRREGULAR_LINE_BREAKS. the scan only reports whether any of them occurs, callers then fall back to the serial path.
+    :param start_in_quotes: whether start is inside a quoted field. if targets is None, both cases are scanned.
+    :param targets: None, or a sorted list of 0-based row-end indices (relative to start) to locate.
+    :param delimiter: single character delimiter.
+    :return: if targets is None, (rows if start is not in quotes, whether end is then in quotes, rows if start is in
+    quotes, whether end is then in quotes, whether an irregular line break occurs); otherwise the list of byte
+    offsets right after each targeted row end.
+    """
+    if start >= end:
+        return [] if targets is not None else (0, start_in_quotes, 0, True, False)
+    with open(file_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if targets is not None:
+            offsets = []
+            if not targets:
+                return offsets
+            for i, offset in enumerate(helper_iter_row_ends(mm, start, end, delimiter, start_in_quotes)):
+                if i == targets[len(offsets)]:
+                    offsets.append(offset)
+                    if len(offsets) == len(targets):
+                        break
+            return offsets
+        irregular = IRREGULAR_LINE_BREAKS_RE.search(mm, start, min(end + 2, len(mm)))
+        irregular = irregular is not None and irregular.start() < end
+        result = []
+        for in_quotes in (False, True):
+            rows = helper_iter_row_ends(mm, start, end, delimiter, in_quotes)
+            n_rows = 0
+            while True:
+                try:
+                    next(rows)
+                    n_rows += 1
+                except StopIteration as stop:
+                    result += [n_rows, stop.value]
+                    break
+        return tuple(result) + (irregular,)
+
+
+def helper_snap_bounds(file_path, bounds):
+    """
+    move every inner bound right after the next b'\n', dropping duplicates, so that ranges start at a row start or
+    inside a quoted field, never in the middle of a field's quote handling.
+    """
+    size = os.path.getsize(file_path)
+    snapped = [bounds[0]]
+    with open(file_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for bound in bounds[1:-1]:
+            nl = mm.find(b'\n', max(bound, snapped[-1]) - 1) if bound > 0 else -1
+            bound = size if nl == -1 else nl + 1
+            if bound > snapped[-1] and bound < bounds[-1]:
+                snapped.append(bound)
+    return snapped + [bounds[-1]]
+
+
+def helper_write_segment(file_path, start, n_rows, current_filepath, delimiter, header=None):
+    """
+    parse n_rows rows of file_path from byte offset start and write them (after header, if any) to current_filepath.
+    :return: how many rows are actually written.
+    """
+    csv.field_size_limit(sys.maxsize)
+    i = 0
+    with open(file_path, 'rb') as rfp:
+        rfp.seek(start)
+        reader = csv.reader(codecs.getreader('utf-8')(rfp), delimiter=delimiter)
+        with codecs.open(current_filepath, "w+", encoding="utf-8") as fp:
+            writer = csv.writer(fp, delimiter=delimiter)
+            if header is not None:
+                writer.writerow(header)
+            for row in reader:
+                if i == n_rows:
+                    break
+                writer.writerow(row)
+                i += 1
+    return i
+
+
+def helper_read_header(file_path, delimiter):
+    """
+    :return: the first row of file_path and the byte offset right after it.
+    """
+    size = os.path.getsize(file_path)
+    header_end = helper_scan_row_ends(file_path, 0, size, targets=[0], delimiter=delimiter)
+    with codecs.open(file_path, "r", encoding="utf-8") as fp:
+        csv.field_size_limit(sys.maxsize)
+        header = next(csv.reader(fp, delimiter=delimiter))
+    return header, header_end[0] if header_end else size
+
+
+def helper_count_rows(file_path, data_start, executor, n_ranges, delimiter):
+    """
+    count the rows after byte offset data_start in parallel.
+    the file is cut into n_ranges byte ranges (snapped to right after a b'\n', see helper_snap_bounds), and every range
+    is scanned for row ends in the pool both as if it started at a row start and as if it started inside a quoted
+    field (helper_scan_row_ends). the ranges are then chained from data_start, which is a row start.
+    :return: (bounds, in_quotes, rows, n_total): the range bounds, whether each range starts inside a quoted field,
+    the row ends in each range and the total number of rows. None if the file ends inside a quoted field or holds an
+    irregular line break (see helper_scan_row_ends).
+    """
+    size = os.path.getsize(file_path)
+    n_ranges = max(1, min(n_ranges, (size - data_start) // (1 << 20)))
+    bounds = [data_start + (size - data_start) * i // n_ranges for i in range(n_ranges + 1)]
+    bounds = helper_snap_bounds(file_path, bounds)
+    n_ranges = len(bounds) - 1
+    scans = list(executor.map(helper_scan_row_ends, [file_path] * n_ranges, bounds[:-1], bounds[1:],
+                              [False] * n_ranges, [None] * n_ranges, [delimiter] * n_ranges))
+    if any(scan[4] for scan in scans):
+        return None
+    in_quotes = []
+    rows = []
+    state = False
+    for rows_out, end_out, rows_in, end_in, _ in scans:
+        in_quotes.append(state)
+        rows.append(rows_in if state else rows_out)
+        state = end_in if state else end_out
+    if state:
+        return None
+    n_total = sum(rows)
+    if size > data_start:
+        with open(file_path, 'rb') as fp:
+            fp.seek(size - 1)
+            if fp.read(1) != b'\n':
+                n_total += 1  # the last row has no trailing newline.
+    return bounds, in_quotes, rows, n_total
+
+
+def helper_row_offsets(file_path, counted_rows, row_indices, executor, delimiter):
+    """
+    locate the byte offsets where the given rows start, in parallel.
+    :param counted_rows: what helper_count_rows returned.
+    :param row_indices: sorted 0-based row indices. rows past the end of the file start at the file size.
+    :return: list of byte offsets.
+    """
+    bounds, in_quotes, rows, n_total = counted_rows
+    n_ranges = len(rows)
+    # row r starts right after row end r - 1.
+    targets = [[] for _ in range(n_ranges)]
+    k = 0
+    seen = 0
+    offsets = []
+    for row in row_indices:
+        if row == 0:
+            offsets.append(bounds[0])
+            continue
+        while k < n_ranges and row - 1 >= seen + rows[k]:
+            seen += rows[k]
+            k += 1
+        if k < n_ranges:
+            targets[k].append(row - 1 - seen)
+    futures = {k: executor.submit(helper_scan_row_ends, file_path, bounds[k], bounds[k + 1], in_quotes[k],
+                                  targets[k], delimiter) for k in range(n_ranges) if targets[k]}
+    for k in sorted(futures):
+        offsets += futures[k].result()
+    return offsets + [bounds[-1]] * (len(row_indices) - len(offsets))
+
+
+def helper_partition_rows(file_path, start, n_rows, delimiter, key_index, output_paths, buffer_bytes=1 << 20):
+    """
+    parse n_rows rows (None for all) of file_path from byte offset start and append each of them to
+    output_paths[zlib.crc32(row[key_index].encode('utf-8')) % len(output_paths)].
+    :return: how many rows are actually partitioned.
+    """
+    csv.field_size_limit(sys.maxsize)
+    i = 0
+    appenders = [TsvAppender(output_path, delimiter, max_buffer_bytes=buffer_bytes, compression=None)
+                 for output_path in output_paths]
+    try:
+        with open(file_path, 'rb') as rfp:
+            rfp.seek(start)
+            for row in csv.reader(codecs.getreader('utf-8')(rfp), delimiter=delimiter):
+                if i == n_rows:
+                    break
+                appenders[zlib.crc32(row[key_index].encode('utf-8')) % len(appenders)].writerow(row)
+                i += 1
+    finally:
+        for appender in appenders:
+            appender.close()
+    return i
+
+
+def helper_parallel_segment_delimited(file_path, destination_path, segmentation_length, duplicate_header, delimiter,
+                                      workers):
+    """
+    parallel version of segment_large_csv and segment_large_tsv.
+    the rows are counted and the segment boundaries located in a process pool (helper_count_rows, helper_row_offsets),
+    then every segment is parsed and written by its own worker (helper_write_segment).
+    :return: how many files are segmented, or None if the file is not quoted consistently (so the boundaries can not
+    be trusted) and the caller should fall back to the serial path.
+    """
+    if os.path.getsize(file_path) == 0:
+        return None
+    filename, file_extension = os.path.splitext(os.path.basename(file_path))
+    header = None
+    data_start = 0
+    if duplicate_header:
+        header, data_start = helper_read_header(file_path, delimiter)
+        if helper_scan_row_ends(file_path, 0, data_start, delimiter=delimiter)[4]:
+            return None
+        segmentation_length += 1
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        counted_rows = helper_count_rows(file_path, data_start, executor, workers * 4, delimiter)
+        if counted_rows is None:
+            return None
+        n_total = counted_rows[-1]
+        n_segments = n_total // segmentation_length + 1
+        starts = helper_row_offsets(file_path, counted_rows, [j * segmentation_length for j in range(n_segments)],
+                                    executor, delimiter)
+        futures = []
+        for j in range(n_segments):
+            n_rows = min(segmentation_length, n_total - j * segmentation_length)
+            current_filepath = os.path.join(destination_path, filename + str(j + 1) + file_extension)
+            futures.append((n_rows, executor.submit(helper_write_segment, file_path, starts[j], n_rows,
+                                                    current_filepath, delimiter, header)))
+        if any(future.result() != n_rows for n_rows, future in futures):
+            return None
+    return n_segments
@@ -1,14 +1,40 @@
+import os
 import pathlib
+import threading
+import uuid
+
 import pandas as pd
 
 
-def parquet_append(filepath: pathlib.Path or str, df: pd.DataFrame) -> None:
+def parquet_append(filepath: pathlib.Path or str, df: pd.DataFrame, streaming=False, batch_size=1 << 16) -> None:
     """
     Append to dataframe to existing .parquet file. Reads original .parquet file in, appends new dataframe, writes new .parquet file out.
+    For repeated appends, use AppendableParquetDataset, whose appends only write the new rows.
     :param filepath: Filepath for parquet file.
     :param df: Pandas dataframe to append. Must be same schema as original.
+    :param streaming: Copy the original file batch_size rows at a time into a temporary file, append df, then rename the temporary file over the original. Peak memory is one batch instead of the whole table, and a failure leaves the original file untouched.
+    :param batch_size: Rows per copied batch if streaming.
     """
     import pyarrow
+    import pyarrow.parquet
+    if streaming:
+        original_file = pyarrow.parquet.ParquetFile(filepath, memory_map=True)
+        schema = original_file.schema_arrow
+        table_to_append = pyarrow.Table.from_pandas(df).cast(schema)  # Same cast as below.
+        tmp_filepath = str(filepath) + '.tmp' + str(os.getpid())
+        try:
+            with pyarrow.parquet.ParquetWriter(tmp_filepath, schema) as handle:
+                for batch in original_file.iter_batches(batch_size=batch_size, use_threads=True):
+                    handle.write_batch(batch)
+                handle.write_table(table_to_append)
+        except BaseException:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+            raise
+        finally:
+            original_file.close()
+        os.replace(tmp_filepath, filepath)
+        return
     table_original_file = pyarrow.parquet.read_table(source=filepath,  pre_buffer=False, use_threads=True, memory_map=True)  # Use memory map for speed.
     table_to_append = pyarrow.Table.from_pandas(df)
     table_to_append = table_to_append.cast(table_original_file.schema)  # Attempt to cast new schema to existing, e.g. datetime64[ns] to datetime64[us] (may throw otherwise).
@@ -16,3 +42,265 @@ def parquet_append(filepath: pathlib.Path or str, df: pd.DataFrame) -> None:
     handle.write_table(table_original_file)
     handle.write_table(table_to_append)
     handle.close()  # Writes binary footer. Until this occurs, .parquet file is not usable.
+
+
+def parquet_read(path, columns=None, filters=None, batch_size=None, output='pandas'):
+    """
+    Read counterpart of parquet_append and AppendableParquetDataset, reading only what is asked for.
+    >>> parquet_read('a.parquet', columns=['user_id', 'score'], filters=[('score', '>', 0.5)])
+    >>> for df in parquet_read('events.parquet.d', filters=[('day', '=', '2022-01-01')], batch_size=100000):
+    ...     pass
+    :param path: a parquet file, a directory of parquet files, or an AppendableParquetDataset directory (only its committed parts are read).
+    :param columns: None for all columns, or the columns to read (column projection, the others are never decoded).
+    :param filters: None, a pyarrow.compute.Expression, or filters in the pyarrow.parquet DNF form, e.g. [('a', '>', 1), ('b', 'in', ['x', 'y'])]. Row groups whose statistics rule out the filters are skipped without being read, the remaining rows are filtered exactly.
+    :param batch_size: None to return everything at once, or the maximum rows per batch to stream them.
+    :param output: 'pandas' for DataFrames, 'arrow' for pyarrow Tables (RecordBatches if streaming).
+    :return: a DataFrame / Table, or a generator of them if batch_size is given.
+    """
+    import pyarrow.dataset
+    import pyarrow.fs
+    import pyarrow.parquet
+    source = str(path)
+    if os.path.isfile(os.path.join(source, AppendableParquetDataset.MANIFEST)):
+        source = AppendableParquetDataset(source).part_paths()
+    if filters is not None and not isinstance(filters, pyarrow.dataset.Expression):
+        filters = pyarrow.parquet.filters_to_expression(filters)
+    dataset = pyarrow.dataset.dataset(source, format='parquet', filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
+    if batch_size is None:
+        table = dataset.to_table(columns=columns, filter=filters)
+        return table.to_pandas() if output == 'pandas' else table
+    return helper_iter_batches(dataset.scanner(columns=columns, filter=filters, batch_size=batch_size), output)
+
+
+def helper_iter_batches(scanner, output='pandas'):
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch.to_pandas() if output == 'pandas' else batch
+
+
+def helper_open_delimited_stream(file_path, delimiter=None, schema=None, block_size=1 << 24, newlines_in_values=True):
+    """
+    open a tsv/csv as a stream of pyarrow record batches of about block_size bytes each.
+    :param delimiter: None to pick '\\t' for .tsv files and ',' otherwise.
+    :param schema: None to infer the column types from the first block, or a pyarrow.Schema to enforce.
+    :param newlines_in_values: whether quoted fields may contain newlines (csv.writer emits them), slower if True.
+    """
+    import pyarrow.csv
+    from mzutils.os_funcs import basename_and_extension
+    if delimiter is None:
+        delimiter = '\t' if basename_and_extension(file_path)[1].lower() == '.tsv' else ','
+    read_options = pyarrow.csv.ReadOptions(block_size=block_size)
+    parse_options = pyarrow.csv.ParseOptions(delimiter=delimiter, newlines_in_values=newlines_in_values)
+    convert_options = pyarrow.csv.ConvertOptions()
+    if schema is not None:
+        read_options.column_names = schema.names
+        read_options.skip_rows = 1
+        convert_options.column_types = schema
+    return pyarrow.csv.open_csv(file_path, read_options=read_options, parse_options=parse_options,
+                                convert_options=convert_options)
+
+
+def convert_delimited_to_parquet(file_path, output_path=None, delimiter=None, schema=None, block_size=1 << 24,
+                                 row_group_size=1 << 20, compression='snappy', newlines_in_values=True):
+    """
+    stream a tsv/csv (with a header row) into a parquet file, one record batch at a time, so memory stays
+    bounded by block_size no matter how large the file is.
+    :param file_path:
+    :param output_path: None to write next to file_path with the .parquet extension.
+    :param delimiter: None to pick '\\t' for .tsv files and ',' otherwise.
+    :param schema: None to infer the column types from the first block, or a pyarrow.Schema to enforce. if a later
+    block does not fit the inferred types, pyarrow.ArrowInvalid (naming the column and row) is raised; pass a schema
+    (e.g. pyarrow.string() for that column) then.
+    :param block_size: bytes read and parsed per record batch.
+    :param row_group_size: maximum number of rows per row group.
+    :param compression: parquet compression codec.
+    :return: output_path, which is written through a temporary file and only replaced once the conversion succeeded.
+    """
+    import pyarrow.parquet
+    from mzutils.os_funcs import parent_dir_and_name, basename_and_extension
+    if output_path is None:
+        output_path = os.path.join(parent_dir_and_name(file_path)[0], basename_and_extension(file_path)[0]) + '.parquet'
+    reader = helper_open_delimited_stream(file_path, delimiter, schema, block_size, newlines_in_values)
+    tmp_path = output_path + '.tmp' + str(os.getpid())
+    try:
+        with pyarrow.parquet.ParquetWriter(tmp_path, reader.schema, compression=compression) as writer:
+            for batch in reader:
+                writer.write_batch(batch, row_group_size=row_group_size)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def convert_delimited_to_arrow(file_path, output_path=None, delimiter=None, schema=None, block_size=1 << 24,
+                               newlines_in_values=True):
+    """
+    stream a tsv/csv (with a header row) into an arrow IPC (feather v2) file, one record batch at a time.
+    see convert_delimited_to_parquet.
+    :return: output_path.
+    """
+    import pyarrow.ipc
+    from mzutils.os_funcs import parent_dir_and_name, basename_and_extension
+    if output_path is None:
+        output_path = os.path.join(parent_dir_and_name(file_path)[0], basename_and_extension(file_path)[0]) + '.arrow'
+    reader = helper_open_delimited_stream(file_path, delimiter, schema, block_size, newlines_in_values)
+    tmp_path = output_path + '.tmp' + str(os.getpid())
+    try:
+        with pyarrow.ipc.new_file(tmp_path, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+class AppendableParquetDataset:
+    """
+    a parquet dataset that can be appended to in time proportional to the appended rows, unlike parquet_append which
+    rewrites the whole file. it is a directory of part files plus a small _manifest.json listing them in order.
+    every append writes one new part file and then commits a new manifest atomically (temporary file + rename), so a
+    crash never loses or corrupts the rows already committed, and readers only ever see committed parts.
+    compact() merges runs of small parts into bigger ones, optionally in a background thread.
+    a dataset expects a single writing process.
+    >>> dataset = AppendableParquetDataset('events.parquet.d')
+    >>> dataset.append(df)
+    >>> dataset.compact(background=True)
+    >>> dataset.read(columns=['user_id']).to_pandas()
+    """
+
+    MANIFEST = '_manifest.json'
+
+    def __init__(self, path):
+        from mzutils.os_funcs import mkdir_p
+        self.path = str(path)
+        mkdir_p(self.path)
+        self.lock = threading.Lock()  # guards the manifest read-modify-write.
+        self.compact_lock = threading.Lock()
+
+    def manifest(self):
+        """
+        :return: the committed manifest, {'parts': [{'name': file name, 'num_rows': rows}, ...]}.
+        """
+        from mzutils.json_funcs import load_json
+        manifest_path = os.path.join(self.path, self.MANIFEST)
+        if not os.path.isfile(manifest_path):
+            return {'parts': []}
+        return load_json(manifest_path)
+
+    def commit(self, manifest):
+        from mzutils.json_funcs import dump_json
+        tmp_path = os.path.join(self.path, self.MANIFEST + '.tmp' + uuid.uuid4().hex)
+        dump_json(manifest, tmp_path, compression=None)
+        os.replace(tmp_path, os.path.join(self.path, self.MANIFEST))
+
+    def part_paths(self):
+        return [os.path.join(self.path, part['name']) for part in self.manifest()['parts']]
+
+    def schema(self):
+        """
+        :return: the pyarrow.Schema of the dataset, None if nothing is appended yet.
+        """
+        import pyarrow.parquet
+        paths = self.part_paths()
+        return pyarrow.parquet.read_schema(paths[0]) if paths else None
+
+    def write_part(self, table):
+        """
+        write table as a new (uncommitted) part file.
+        :return: the manifest entry of the part.
+        """
+        import pyarrow.parquet
+        name = 'part-' + uuid.uuid4().hex + '.parquet'
+        tmp_path = os.path.join(self.path, '.' + name + '.tmp')
+        pyarrow.parquet.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, name))
+        return {'name': name, 'num_rows': table.num_rows}
+
+    def append(self, df: pd.DataFrame) -> None:
+        """
+        :param df: Pandas dataframe to append. Must be same schema as the rows already appended (it is cast to it,
+        e.g. datetime64[ns] to datetime64[us]).
+        """
+        import pyarrow
+        table = pyarrow.Table.from_pandas(df)
+        schema = self.schema()
+        if schema is not None:
+            table = table.cast(schema)
+        part = self.write_part(table)
+        with self.lock:
+            manifest = self.manifest()
+            manifest['parts'].append(part)
+            self.commit(manifest)
+
+    def read(self, columns=None):
+        """
+        :return: the committed rows as a pyarrow.Table.
+        """
+        import pyarrow
+        import pyarrow.parquet
+        paths = self.part_paths()
+        if not paths:
+            return pyarrow.table({})
+        return pyarrow.concat_tables(pyarrow.parquet.read_table(path, columns=columns, memory_map=True)
+                                     for path in paths)
+
+    def compact(self, min_rows=1 << 20, background=False, row_group_size=1 << 20):
+        """
+        merge every run of consecutive parts smaller than min_rows into one part, keeping the row order. the merged
+        part is written next to the old ones, committed, and only then are the old parts removed.
+        :param min_rows:
+        :param background: run in a daemon thread, which is returned (appends can go on meanwhile).
+        :param row_group_size: rows per row group of the merged parts. the source batches are buffered up to it, so
+        the merged part is not as fragmented as the small parts were.
+        """
+        if background:
+            thread = threading.Thread(target=self.compact, args=(min_rows, False, row_group_size), daemon=True)
+            thread.start()
+            return thread
+        import pyarrow.parquet
+        with self.compact_lock:
+            runs = []
+            run = []
+            for part in self.manifest()['parts'] + [None]:
+                if part is not None and part['num_rows'] < min_rows:
+                    run.append(part)
+                    continue
+                if len(run) > 1:
+                    runs.append(run)
+                run = []
+            for run in runs:
+                name = 'part-' + uuid.uuid4().hex + '.parquet'
+                tmp_path = os.path.join(self.path, '.' + name + '.tmp')
+                paths = [os.path.join(self.path, part['name']) for part in run]
+                schema = pyarrow.parquet.read_schema(paths[0])
+                with pyarrow.parquet.ParquetWriter(tmp_path, schema) as writer:
+                    batches = []
+                    n_rows = 0
+                    for path in paths:
+                        for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+                            batches.append(batch)
+                            n_rows += batch.num_rows
+                            if n_rows >= row_group_size:
+                                table = pyarrow.Table.from_batches(batches, schema)
+                                n_full = n_rows - n_rows % row_group_size
+                                writer.write_table(table.slice(0, n_full), row_group_size=row_group_size)
+                                batches = table.slice(n_full).to_batches()
+                                n_rows -= n_full
+                    if n_rows:
+                        writer.write_table(pyarrow.Table.from_batches(batches, schema), row_group_size=row_group_size)
+                os.replace(tmp_path, os.path.join(self.path, name))
+                names = [part['name'] for part in run]
+                with self.lock:
+                    manifest = self.manifest()
+                    current = [part['name'] for part in manifest['parts']]
+                    i = current.index(names[0])
+                    manifest['parts'][i:i + len(names)] = [{'name': name,
+                                                            'num_rows': sum(part['num_rows'] for part in run)}]
+                    self.commit(manifest)
+                for path in paths:
+                    os.remove(path)
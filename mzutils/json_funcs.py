@@ -1,23 +1,227 @@
-import codecs
 import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
+from mzutils.os_funcs import open_compressed
 
-def dump_json(dictionary, file_path):
+JSON_BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def get_json_backend(backend=None, candidates=JSON_BACKENDS):
+    """
+    :param backend: None for the fastest installed one of candidates, or one of JSON_BACKENDS.
+    :return: the backend module.
+    """
+    for name in candidates if backend is None else (backend,):
+        try:
+            return __import__(name)
+        except ImportError:
+            if backend is not None:
+                raise
+    return json
+
+
+def helper_json_dumps(obj, ensure_ascii=True, indent=None, backend=None):
+    """
+    encode obj to utf-8 json bytes like json.dumps(obj, ensure_ascii=ensure_ascii, indent=indent) would.
+    orjson is only used when it can honor the options (ensure_ascii=False, indent None or 2), ujson whenever it is
+    installed. whatever the backend can not encode (e.g. orjson: integers over 64 bits, ujson: nan) is encoded by json.
+    the output may differ in whitespace between backends, but decodes to the same object. orjson writes nan and inf as
+    null, so objects holding them are encoded by json (which writes NaN / Infinity) too.
+    """
+    module = get_json_backend(backend)
+    if module.__name__ == 'orjson' and (ensure_ascii or indent not in (None, 2)):
+        module = get_json_backend(candidates=('ujson', 'json')) if backend is None else json
+    try:
+        if module.__name__ == 'orjson':
+            option = module.OPT_NON_STR_KEYS | module.OPT_SERIALIZE_NUMPY
+            if indent == 2:
+                option |= module.OPT_INDENT_2
+            data = module.dumps(obj, option=option)
+            if b'null' not in data or not helper_has_non_finite(obj):
+                return data
+            module = json
+        if module.__name__ == 'ujson':
+            return module.dumps(obj, ensure_ascii=ensure_ascii, indent=0 if indent is None else indent,
+                                escape_forward_slashes=False).encode('utf-8')
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return json.dumps(obj, ensure_ascii=ensure_ascii, indent=indent, default=helper_numpy_default).encode('utf-8')
+
+
+def helper_has_non_finite(obj):
+    """
+    whether obj (nested dicts, lists and tuples, numpy arrays included) holds a nan or an infinite float.
+    """
+    numpy = sys.modules.get('numpy')  # if numpy is not imported, obj holds no arrays.
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, float):
+            if not math.isfinite(item):
+                return True
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif numpy is not None and isinstance(item, (numpy.ndarray, numpy.floating)):
+            if numpy.issubdtype(item.dtype, numpy.floating) and not numpy.isfinite(item).all():
+                return True
+            if isinstance(item, numpy.ndarray) and item.dtype == object:
+                stack.extend(item.ravel().tolist())
+    return False
+
+
+def helper_numpy_default(obj):
+    """
+    json.dumps default= hook encoding numpy arrays and scalars as lists and numbers, as orjson does.
+    """
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and isinstance(obj, (numpy.ndarray, numpy.generic)):
+        return obj.tolist()
+    raise TypeError("Object of type %s is not JSON serializable" % obj.__class__.__name__)
+
+
+def helper_json_loads(data, backend=None):
+    """
+    decode json bytes with the fastest installed backend, falling back to json for what it rejects
+    (e.g. orjson: nan, infinity and integers over 64 bits).
+    """
+    module = get_json_backend(backend)
+    if module is not json:
+        try:
+            return module.loads(data)
+        except (ValueError, OverflowError):
+            pass
+    return json.loads(data)
+
+
+def dump_json(dictionary, file_path, compression='infer', ensure_ascii=True, indent=None, backend=None):
     """
     
     :param dict:
     :param file_path:
+    :param compression: see mzutils.os_funcs.open_compressed, e.g. 'infer' writes a.json.gz through gzip.
+    :param ensure_ascii: like json.dump. ensure_ascii=False lets orjson (the fastest backend) do the encoding.
+    :param indent: like json.dump.
+    :param backend: None for the fastest installed one of orjson, ujson and json, or one of them.
     :return:
     """
-    with codecs.open(file_path, 'w+', encoding='utf-8') as fp:
-        json.dump(dictionary, fp)
+    with open_compressed(file_path, 'wb', compression) as fp:
+        fp.write(helper_json_dumps(dictionary, ensure_ascii=ensure_ascii, indent=indent, backend=backend))
 
 
-def load_json(file_path):
+def load_json(file_path, compression='infer', backend=None):
     """
 
     :param file_path:
+    :param compression: see mzutils.os_funcs.open_compressed, e.g. 'infer' reads a.json.gz through gzip.
+    :param backend: None for the fastest installed one of orjson, ujson and json, or one of them.
     :return: dict object
     """
-    with codecs.open(file_path, 'r', encoding='utf-8') as fp:
-        return json.load(fp)
+    with open_compressed(file_path, 'rb', compression) as fp:
+        return helper_json_loads(fp.read(), backend=backend)
+
+
+def iter_jsonl(file_path, compression='infer', backend=None):
+    """
+    lazily read a json lines file (one json document per line), one record at a time. blank lines are skipped.
+    :param file_path:
+    :param compression: see mzutils.os_funcs.open_compressed.
+    :param backend: see load_json.
+    :return: a generator of records.
+    """
+    with open_compressed(file_path, 'rb', compression) as fp:
+        for line in fp:
+            if line.strip():
+                yield helper_json_loads(line, backend=backend)
+
+
+def dump_jsonl(records, file_path, compression='infer', ensure_ascii=True, backend=None, mode='wb'):
+    """
+    write an iterable of records to a json lines file, one record per line, without holding them all in memory.
+    :param records:
+    :param file_path:
+    :param compression: see mzutils.os_funcs.open_compressed.
+    :param ensure_ascii: see dump_json.
+    :param backend: see dump_json.
+    :param mode: 'wb' to overwrite, 'ab' to append.
+    :return: how many records are written.
+    """
+    i = 0
+    with open_compressed(file_path, mode, compression) as fp:
+        for record in records:
+            fp.write(helper_json_dumps(record, ensure_ascii=ensure_ascii, backend=backend) + b'\n')
+            i += 1
+    return i
+
+
+def append_jsonl(records, file_path, compression='infer', ensure_ascii=True, backend=None):
+    """
+    append an iterable of records to a json lines file. see dump_jsonl.
+    """
+    return dump_jsonl(records, file_path, compression=compression, ensure_ascii=ensure_ascii, backend=backend,
+                      mode='ab')
+
+
+def load_jsonl(file_path, workers=None, compression='infer', backend=None):
+    """
+    read a json lines file into a list of records.
+    :param file_path:
+    :param workers: if > 1, the (uncompressed) file is split into byte ranges on newline boundaries, which are parsed
+    in a process pool. records are returned in file order either way.
+    :param compression: see mzutils.os_funcs.open_compressed. compressed files are always parsed serially.
+    :param backend: see load_json.
+    :return: list of records.
+    """
+    from mzutils.os_funcs import infer_compression
+    if workers is None or workers <= 1 or infer_compression(file_path, compression)[0] is not None:
+        return list(iter_jsonl(file_path, compression=compression, backend=backend))
+    size = os.path.getsize(file_path)
+    n_ranges = max(1, min(workers * 4, size // (1 << 20)))
+    bounds = [0]
+    with open(file_path, 'rb') as fp:
+        for i in range(1, n_ranges):
+            # every range starts right after a newline, json lines can not contain raw newlines.
+            fp.seek(max(size * i // n_ranges, bounds[-1]))
+            fp.readline()
+            bounds.append(min(fp.tell(), size))
+    bounds.append(size)
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(helper_load_jsonl_range, [file_path] * n_ranges, bounds[:-1], bounds[1:],
+                                  [backend] * n_ranges):
+            records += chunk
+    return records
+
+
+def iter_json_items(file_path, prefix='item', compression='infer'):
+    """
+    incrementally parse a (huge) json document with ijson and yield the objects under prefix one at a time, so
+    memory stays proportional to one object instead of the whole document.
+    >>> for article in iter_json_items('train-v1.1.json', 'data.item'):  # SQuAD articles
+    ...     pass
+    :param file_path:
+    :param prefix: ijson prefix, e.g. 'item' for the elements of a top-level array, 'data.item' for those of the
+    array under the "data" key.
+    :param compression: see mzutils.os_funcs.open_compressed.
+    :return: a generator of objects, numbers are parsed as int / float like json.load does.
+    """
+    import ijson
+    with open_compressed(file_path, 'rb', compression) as fp:
+        yield from ijson.items(fp, prefix, use_float=True)
+
+
+# ------------------helper funcs-----------------------------
+
+
+def helper_load_jsonl_range(file_path, start, end, backend=None):
+    """
+    parse the json lines in bytes [start, end) of file_path, start and end being right after newlines.
+    """
+    with open(file_path, 'rb') as fp:
+        fp.seek(start)
+        data = fp.read(end - start)
+    return [helper_json_loads(line, backend=backend) for line in data.splitlines() if line.strip()]
@@ -1,19 +1,46 @@
+import sys
+from collections.abc import Iterable
+from itertools import islice
+
+
 def remove_elements_from_list(lst: list, elements: list):
     """
     remove elements from lst.
+    membership is checked against a set of elements (O(n + m)); if lst or elements hold unhashable items, against the
+    elements list itself (O(n * m)). a numpy array lst gives back the numpy array of the kept elements.
     """
-    return [e for e in lst if e not in elements]
+    if helper_is_ndarray(lst) and lst.dtype != object:
+        import numpy as np
+        return lst[~np.isin(lst, elements)]
+    try:
+        element_set = set(elements)
+        return [e for e in lst if e not in element_set]
+    except TypeError:
+        return [e for e in lst if e not in elements]
 
 
 def pop_indices(lst, indices):
     """
     pop the lst given a list or tuple of indices.
-    this function modifies lst directly inplace.
+    this function modifies lst directly inplace, rebuilding it in one pass.
+    a numpy array can not shrink inplace, a new array without indices is returned instead.
     >>> pop_indices([1,2,3,4,5,6], [0,4,5])
     >>> [2, 3, 4]
     """
-    for n in sorted(indices, reverse=True):
-        lst.pop(n)
+    if helper_is_ndarray(lst):
+        import numpy as np
+        return np.delete(lst, indices)
+    n = len(lst)
+    drop = set()
+    for i in indices:
+        if not -n <= i < n:
+            raise IndexError("pop index out of range")
+        drop.add(i % n)
+    if len(drop) != len(indices):  # repeated indices pop successive elements, keep the sequential semantics.
+        for i in sorted(indices, reverse=True):
+            lst.pop(i)
+        return lst
+    lst[:] = [e for i, e in enumerate(lst) if i not in drop]
     return lst
 
 
@@ -21,28 +48,91 @@ def pad_list(lst: list, length: int, element=''):
     """
     pad a list to length with elements.
     returned list will have length equal to length.
+    a numpy array is padded (or cut) along its first axis, element then has to fit its dtype; the default '' pads
+    numeric and boolean arrays with 0 / False.
     """
     if len(lst) >= length:
         return lst[:length]
-
-    return lst + [element for _ in range(length - len(lst))]
+    if helper_is_ndarray(lst):
+        import numpy as np
+        if isinstance(element, str) and element == '' and lst.dtype.kind not in 'USO':
+            element = 0
+        return np.pad(lst, [(0, length - len(lst))] + [(0, 0)] * (lst.ndim - 1), constant_values=element)
+    return lst + [element] * (length - len(lst))
 
 
 def split_list_with_len(lst: list, length: int):
     """
     return a list of sublists with len == length (except the last one)
     """
-    return [lst[i:i + length] for i in range(0, len(lst), length)]
+    return list(ichunks(lst, length))
+
+
+def ichunks(iterable, n: int):
+    """
+    lazily yield chunks of n items (except the last one) from any iterable, streams included.
+    lists, tuples, strings, ranges and numpy arrays yield slices of themselves, other iterables yield lists.
+    """
+    if n < 1:
+        raise ValueError("n must be at least 1.")
+    if isinstance(iterable, (list, tuple, str, range)) or helper_is_ndarray(iterable):
+        for i in range(0, len(iterable), n):
+            yield iterable[i:i + n]
+        return
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, n))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, n))
 
 
 def flatten(lst):
     """
     convert nested list to a list of elements.
+    only exact lists are expanded, anything else (lst itself included) is an element.
     """
-    if type(lst) == list:
-        result = []
-        for i in lst:
-            result += flatten(i)
-        return result
-    else:
+    if type(lst) != list:
         return [lst]
+    return list(helper_iflatten(lst, None, lambda item: type(item) == list))
+
+
+def iflatten(obj, max_depth=None, types=(list, tuple)):
+    """
+    lazily yield the elements of a nested obj, without recursion, so arbitrarily deep nests are fine.
+    obj itself is iterated if it is iterable (e.g. a list, range, set, dict view, generator or file) and not a str,
+    bytes or bytearray, anything else is yielded as is. types only governs which nested items are expanded.
+    >>> list(iflatten([1, (2, [3, [4]]), 'ab'], max_depth=2))
+    >>> [1, 2, 3, [4], 'ab']
+    :param max_depth: how many levels to expand, None for all.
+    :param types: types of the containers to expand.
+    """
+    if not isinstance(obj, Iterable) or isinstance(obj, (str, bytes, bytearray)):
+        return iter([obj])
+    return helper_iflatten(obj, max_depth, lambda item: isinstance(item, types))
+
+
+# ------------------helper funcs-----------------------------
+
+
+def helper_is_ndarray(obj):
+    """
+    whether obj is a numpy array, without importing numpy (if numpy is not imported, obj can not be an array).
+    """
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(obj, numpy.ndarray)
+
+
+def helper_iflatten(obj, max_depth, is_container):
+    """
+    iteratively yield the items of obj, descending into the items for which is_container is True up to max_depth
+    levels (None for all), with a stack of iterators instead of recursion.
+    """
+    stack = [iter(obj)]
+    while stack:
+        for item in stack[-1]:
+            if is_container(item) and (max_depth is None or len(stack) <= max_depth):
+                stack.append(iter(item))
+                break
+            yield item
+        else:
+            stack.pop()
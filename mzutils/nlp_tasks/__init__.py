@@ -1,3 +1,39 @@
-from .data_preprocessing import *
-from .ner_funcs import *
-from .nlp_metrics import *
+"""
+submodules are imported lazily on first attribute access, see mzutils/__init__.py.
+"""
+import importlib
+
+_lazy_submodules = {
+    'data_preprocessing': (
+        'generate_multi_test_cases', 'simple_squad_segmentor', 'retrieve_questions_from_triviaQA',
+        'generate_multi_test_cases_triviaQA', 'concatenate_predictions_dicts', 'iter_questions_from_triviaQA',
+        'helper_triviaQA_question',
+    ),
+    'ner_funcs': (
+        'helper_flatten', 'subword_tokenize_labels', 'labels_from_subword_labels',
+        'rejoin_bert_tokenized_sentence',
+    ),
+    'nlp_metrics': (
+        'compute_sentence_pseudo_mlm_perplexity', 'rouge_helper_prepare_results', 'remove_sub_strings',
+        'remove_sub_strings_chinese', 'translation_paraphrase_evaluation_english_tagpa',
+        'translation_paraphrase_evaluation', 'translation_paraphrase_evaluation_chinese',
+    ),
+}
+
+_lazy_names = {name: submodule for submodule, names in _lazy_submodules.items() for name in names}
+__all__ = [name for name in _lazy_submodules if '.' not in name] + list(_lazy_names)
+
+
+def __getattr__(name):
+    if name in _lazy_names:
+        value = getattr(importlib.import_module('.' + _lazy_names[name], __name__), name)
+    elif name in _lazy_submodules:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    globals()[name] = value  # cache it, so __getattr__ is only hit once per name.
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names) | {name for name in _lazy_submodules if '.' not in name})
@@ -1,4 +1,5 @@
 import codecs
+import itertools
 import json
 import os
 
@@ -57,16 +58,32 @@ def generate_multi_test_cases(list_of_paragraphs, list_of_questions, json_store_
         json.dump(jsondict, fp)
 
 
-def simple_squad_segmentor(squad_file_path, store_location, num_of_paragraphs=500):
+def simple_squad_segmentor(squad_file_path, store_location, num_of_paragraphs=500, streaming=False):
+    """
+    segment a SQuAD file into files of num_of_paragraphs articles each.
+    :param squad_file_path:
+    :param store_location:
+    :param num_of_paragraphs:
+    :param streaming: parse the articles incrementally (needs ijson), so memory stays proportional to
+    num_of_paragraphs articles instead of the whole dataset. the segmented files are the same either way.
+    :return: number of segmented files.
+    """
     mzutils.os_funcs.mkdir_p(store_location)
     squad_file_name = mzutils.os_funcs.basename_and_extension(squad_file_path)[0]
-    squad_file_data = mzutils.json_funcs.load_config(squad_file_path)["data"]
-    epoch = len(squad_file_data) // num_of_paragraphs + 1
-    for i in range(epoch):
-        store_dict = {"data": squad_file_data[(i * num_of_paragraphs):((i + 1) * num_of_paragraphs)], "version": "1.1"}
+    if streaming:
+        squad_file_data = mzutils.json_funcs.iter_json_items(squad_file_path, 'data.item')
+    else:
+        squad_file_data = iter(mzutils.json_funcs.load_json(squad_file_path)["data"])
+    i = 0
+    while True:
+        segment = list(itertools.islice(squad_file_data, num_of_paragraphs))
+        store_dict = {"data": segment, "version": "1.1"}
         with codecs.open(os.path.join(store_location, squad_file_name) + str(i) + ".json", 'w+',
                          encoding='utf-8') as fp:
             json.dump(store_dict, fp)
+        i += 1
+        if len(segment) < num_of_paragraphs:
+            return i
 
 
 # ---------------------------------TriviaQA Functions---------------------------------
@@ -82,24 +99,54 @@ def simple_squad_segmentor(squad_file_path, store_location, num_of_paragraphs=50
 # other useless rows omitted.
 
 
-def retrieve_questions_from_triviaQA(file_path, destination_path=None):
+def iter_questions_from_triviaQA(file_path):
     """
+    incrementally parse a TriviaQA file (needs ijson) and yield its questions one at a time, so memory stays
+    proportional to one question instead of the whole dataset.
     :param file_path:
+    :return: generator of {"question" : "", "questionid" : "", "acceptableanswers" : ""}
+    """
+    for data in mzutils.json_funcs.iter_json_items(file_path, 'Data.item'):
+        yield helper_triviaQA_question(data)
+
+
+def retrieve_questions_from_triviaQA(file_path, destination_path=None, streaming=False):
+    """
+    :param file_path:
+    :param streaming: parse the file incrementally with iter_questions_from_triviaQA, and write destination_path
+    question by question, so the dataset is never held in memory.
     :return:[{"Question" : "", "QuestionId" : "", "AcceptableAnswers" : ""}]
+    (a generator of them if streaming)
     or
     None and write {"data": [{"Question" : "", "QuestionId" : "", "AcceptableAnswers" : ""}]}
     """
+    if streaming:
+        questions = iter_questions_from_triviaQA(file_path)
+        if not destination_path:
+            return questions
+        with codecs.open(destination_path, 'w+', encoding='utf-8') as fp:
+            # same bytes as json.dump({"data": [...]}, fp).
+            fp.write('{"data": [')
+            for i, question in enumerate(questions):
+                if i:
+                    fp.write(', ')
+                json.dump(question, fp)
+            fp.write(']}')
+        return
     return_list = []
-    data_list = mzutils.json_funcs.load_config(file_path)["Data"]
+    data_list = mzutils.json_funcs.load_json(file_path)["Data"]
     for data in data_list:
-        AcceptableAnswers = data["Answer"]["Aliases"] + data["Answer"]["NormalizedAliases"] + [
-            data["Answer"]["NormalizedValue"]]
-        return_list.append(
-            {"question": data["Question"], "questionid": data["QuestionId"], "acceptableanswers": AcceptableAnswers})
+        return_list.append(helper_triviaQA_question(data))
     if not destination_path:
         return return_list
     else:
-        mzutils.json_funcs.dump_config(destination_path, {"data": return_list})
+        mzutils.json_funcs.dump_json({"data": return_list}, destination_path)
+
+
+def helper_triviaQA_question(data):
+    AcceptableAnswers = data["Answer"]["Aliases"] + data["Answer"]["NormalizedAliases"] + [
+        data["Answer"]["NormalizedValue"]]
+    return {"question": data["Question"], "questionid": data["QuestionId"], "acceptableanswers": AcceptableAnswers}
 
 
 def generate_multi_test_cases_triviaQA(retrieved_json_path, json_store_path, documents_path, missing_file_path=None):
@@ -112,7 +159,7 @@ def generate_multi_test_cases_triviaQA(retrieved_json_path, json_store_path, doc
         "[0, 0, 'tc_1250', ['The Swiss Miss', 'Martina hingis', 'Martina Hingisov\u00e1', 'Martina Hingis', 'MartinaHingis', 'Martina Hingisova', 'Hingis', 'hingis', 'swiss miss', 'martina hingis', 'martina hingisova', 'martinahingis', 'martina hingisov\u00e1', 'martina hingis']]": "Li Na",
     }
     """
-    retrieved_list = mzutils.json_funcs.load_config(retrieved_json_path)['data']
+    retrieved_list = mzutils.json_funcs.load_json(retrieved_json_path)['data']
     missing_files = []
 
     data = []
@@ -179,6 +226,6 @@ def concatenate_predictions_dicts(squadjsons_files_dir, output_file=None):
                                          "squadjsons" + str(dir_num))  # this is the path of directory squadjsons%d
         if not os.path.isdir(squadjsonsnum_dir):
             break
-        output_dict.update(mzutils.json_funcs.load_config(os.path.join(squadjsonsnum_dir, "predictions.json")))
+        output_dict.update(mzutils.json_funcs.load_json(os.path.join(squadjsonsnum_dir, "predictions.json")))
         dir_num += 1
-    mzutils.json_funcs.dump_config(output_file, output_dict)
+    mzutils.json_funcs.dump_json(output_dict, output_file)
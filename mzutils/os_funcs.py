@@ -1,5 +1,6 @@
 import codecs
 import errno
+import io
 import os
 import shutil
 import tarfile
@@ -7,8 +8,6 @@ import time
 import zipfile
 from inspect import getfullargspec
 
-import nltk
-
 
 def parent_dir_and_name(file_path):
     """
@@ -32,6 +31,71 @@ def basename_and_extension(file_path):
     return os.path.splitext(os.path.basename(file_path))
 
 
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd'}
+
+
+def infer_compression(file_path, compression='infer'):
+    """
+    >>> infer_compression('a/b.tsv.gz')
+    ('gzip', {})
+    >>> infer_compression('a/b.tsv', {'method': 'zstd', 'level': 10, 'threads': -1})
+    ('zstd', {'level': 10, 'threads': -1})
+    :param file_path:
+    :param compression: 'infer' to pick the codec from the extension of file_path, None for no compression, one of
+    'gzip', 'bz2', 'xz', 'zstd', or a dict like {'method': 'zstd', 'level': 3, 'threads': 4}.
+    :return: codec name (or None) and its options.
+    """
+    options = {}
+    if isinstance(compression, dict):
+        options = dict(compression)
+        compression = options.pop('method', 'infer')
+    if compression == 'infer':
+        compression = COMPRESSION_EXTENSIONS.get(os.path.splitext(str(file_path))[1].lower())
+    if compression is not None and compression not in COMPRESSION_EXTENSIONS.values():
+        raise ValueError("compression should be 'infer', None or one of " + str(list(COMPRESSION_EXTENSIONS.values())))
+    return compression, options
+
+
+def open_compressed(file_path, mode='rb', compression='infer', encoding=None):
+    """
+    open a file, (de)compressing it on the fly with gzip, bz2, xz or zstd.
+    uncompressed files are opened as before: open() in binary mode, codecs.open() in text mode.
+    :param file_path:
+    :param mode: like open(), e.g. 'rb', 'wb', 'ab', 'r', 'w+', 'a+'. '+' is ignored for compressed files.
+    :param compression: see infer_compression. the options are 'level' for all codecs and 'threads' for zstd
+    (multi-threaded compression, -1 for all cores).
+    :param encoding: None for binary mode, or the encoding of the text.
+    :return: a file object.
+    """
+    compression, options = infer_compression(file_path, compression)
+    if compression is None:
+        if encoding is None:
+            return open(file_path, mode)
+        return codecs.open(file_path, mode, encoding=encoding)
+    binary_mode = mode.replace('+', '').replace('t', '').replace('b', '') + 'b'
+    level = options.get('level')
+    if compression == 'gzip':
+        import gzip
+        fp = gzip.open(file_path, binary_mode, compresslevel=9 if level is None else level)
+    elif compression == 'bz2':
+        import bz2
+        fp = bz2.open(file_path, binary_mode, compresslevel=9 if level is None else level)
+    elif compression == 'xz':
+        import lzma
+        fp = lzma.open(file_path, binary_mode, preset=None if binary_mode == 'rb' else level)
+    else:
+        import zstandard
+        if binary_mode == 'rb':
+            fp = zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), read_across_frames=True)
+        else:
+            compressor = zstandard.ZstdCompressor(level=3 if level is None else level,
+                                                  threads=options.get('threads', 0))
+            fp = compressor.stream_writer(open(file_path, binary_mode))
+    if encoding is None:
+        return fp
+    return io.TextIOWrapper(fp, encoding=encoding, newline='')
+
+
 def get_things_in_loc(in_path, just_files=True, endswith=None):
     """
     in_path can be file path or dir path.
@@ -172,6 +236,7 @@ def documents_segementor_on_word_length(documents_dir, store_dir, max_length, la
 
 
 def helper_document_segmentor(documents_dir, store_dir, name, max_length, language):
+    import nltk
     documents = []
     with codecs.open(os.path.join(documents_dir, name), "r", "utf-8") as fp:
         filecontent = fp.read()
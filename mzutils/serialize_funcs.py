@@ -1,28 +1,442 @@
+import array
 import codecs
+import functools
+import hashlib
+import io
+import marshal
+import mmap as mmap_module
+import os
 import pickle
+import shutil
+import sys
+import time
+import uuid
+import zipfile
 
+from mzutils.os_funcs import open_compressed
 
-def serialize(obj, location):
-    with open(location, 'wb') as fp:
-        pickle.dump(obj, fp)
+OUT_OF_BAND_MAGIC = b'MZPKL5\n'
+OUT_OF_BAND_ALIGNMENT = 64
+# files of the other formats start with FORMAT_MAGIC + the format name padded to 8 bytes + b'\n'.
+FORMAT_MAGIC = b'MZSER:'
+SERIALIZE_FORMATS = ('pickle', 'msgpack', 'marshal', 'npz')
 
 
-def deserialize(location):
-    with open(location, 'rb') as fp:
+def serialize(obj, location, compression='infer', out_of_band=False, min_buffer_size=1 << 16, format='pickle'):
+    """
+    pickle obj to location.
+    compression: see mzutils.os_funcs.open_compressed, e.g. 'infer' writes a.pkl.zst through zstd.
+    format: one of SERIALIZE_FORMATS, or 'auto' for npz if obj is a dict of str -> numpy arrays and pickle otherwise
+    (see helper_pick_format).
+    pickle files are written as plain pickles, the other formats after a small header, so deserialize detects the
+    format by itself. msgpack keeps plain data portable across languages (tuples are rejected instead of turned into
+    lists), and npz stores dicts of str -> numpy arrays. marshal only stores builtin types, and its files are tied to
+    the python version that wrote them (the marshal format changes between versions), so only use it for caches that
+    are rebuilt on upgrades. neither is faster than pickle in general, see benchmarks/bench_serialize_formats.py.
+    out_of_band: pickle with protocol 5 and write the large buffers (numpy arrays, or anything else that pickles
+    through pickle.PickleBuffer) uncompressed and 64-byte aligned into the sidecar file location + '.buffers',
+    instead of copying them into the pickle stream. deserialize(location, mmap=True) can then map them back without
+    copies.
+    min_buffer_size: buffers smaller than this stay in the pickle stream.
+    """
+    if format == 'auto':
+        format = 'pickle' if out_of_band else helper_pick_format(obj)
+    if format not in SERIALIZE_FORMATS:
+        raise ValueError("format should be 'auto' or one of " + str(SERIALIZE_FORMATS))
+    if format in ('marshal', 'msgpack') and not helper_is_builtin_data(obj):
+        raise TypeError(format + " can only store builtin types exactly, use pickle instead.")
+    if format != 'pickle':
+        data = helper_dumps(obj, format)
+        with open_compressed(location, 'wb', compression) as fp:
+            fp.write(FORMAT_MAGIC + format.ljust(8).encode() + b'\n')
+            fp.write(data)
+        return
+    if not out_of_band:
+        with open_compressed(location, 'wb', compression) as fp:
+            pickle.dump(obj, fp)
+        return
+    buffer_table = []
+    with open(location + '.buffers', 'wb') as bfp:
+        def buffer_callback(buffer):
+            raw = buffer.raw()
+            if raw.nbytes < min_buffer_size:
+                return True  # in-band.
+            offset = bfp.tell()
+            buffer_table.append((offset, raw.nbytes))
+            bfp.write(raw)
+            bfp.write(b'\0' * (-(offset + raw.nbytes) % OUT_OF_BAND_ALIGNMENT))
+            return False
+
+        data = pickle.dumps(obj, protocol=5, buffer_callback=buffer_callback)
+    with open_compressed(location, 'wb', compression) as fp:
+        fp.write(OUT_OF_BAND_MAGIC)
+        pickle.dump(buffer_table, fp)
+        fp.write(data)
+
+
+def deserialize(location, compression='infer', mmap=False):
+    """
+    unpickle the object stored in location, or load it with the format it was serialized with.
+    compression: see mzutils.os_funcs.open_compressed, e.g. 'infer' reads a.pkl.zst through zstd.
+    mmap: for objects serialized with out_of_band=True, rebuild the out-of-band buffers as copy-on-write memory-mapped
+    views of location + '.buffers', so loading costs no copies and no memory until the pages are touched. otherwise
+    the buffers are read into memory.
+    """
+    with open_compressed(location, 'rb', compression) as fp:
+        head = fp.read(len(OUT_OF_BAND_MAGIC))
+        if head.startswith(FORMAT_MAGIC):
+            format = (head[len(FORMAT_MAGIC):] + fp.read(len(FORMAT_MAGIC) + 9 - len(head))).decode().strip()
+            return helper_loads(fp.read(), format)
+        if head == OUT_OF_BAND_MAGIC:
+            buffer_table = pickle.load(fp)
+            buffers = []
+            if buffer_table:
+                with open(location + '.buffers', 'rb') as bfp:
+                    if mmap:
+                        view = memoryview(mmap_module.mmap(bfp.fileno(), 0, access=mmap_module.ACCESS_COPY))
+                        buffers = [view[offset:offset + nbytes] for offset, nbytes in buffer_table]
+                    else:
+                        for offset, nbytes in buffer_table:
+                            buffers.append(bytearray(nbytes))
+                            bfp.seek(offset)
+                            bfp.readinto(buffers[-1])
+            return pickle.load(fp, buffers=buffers)
+    with open_compressed(location, 'rb', compression) as fp:
         return pickle.load(fp)
 
 
-def serialize_file_to_list(file_location, location, strip=False):
+def serialize_file_to_list(file_location, location, strip=False, format='pickle'):
     """
     serialize a file from file_location to a list of sentences in location as a python pickle
     file_location: location of file to load
     location: location of pickle
     strip: whether rstrip the sentence to get rid of \n
+    format: see serialize, e.g. 'marshal' or 'msgpack' write a list of str a bit faster than pickle.
     """
     with codecs.open(file_location, 'r', 'utf-8') as fpr:
         if strip:
             sentences = fpr.readlines()
         else:
             sentences = [line.rstrip() for line in fpr]
-    with open(location, 'wb') as fp:
-        pickle.dump(sentences, fp)
+    serialize(sentences, location, format=format)
+
+
+class SentenceStore:
+    """
+    a read-only list of sentences backed by one contiguous utf-8 blob (location) and a uint64 array of the
+    sentence offsets (location + '.offsets', a numpy .npy file with len(store) + 1 entries), both memory-mapped.
+    opening it is instant whatever its size, a sentence costs no memory until it is read, and the pages are shared by
+    every process that opens the same store. pickling a store only pickles its location.
+    >>> write_sentence_store(['a sentence.', 'another one.'], 'corpus.sentences')
+    >>> store = SentenceStore('corpus.sentences')
+    >>> len(store), store[1], store[-1:], list(store)
+    """
+
+    def __init__(self, location):
+        import numpy as np
+        self.location = location
+        self.offsets = np.load(location + '.offsets', mmap_mode='r')
+        self.fp = open(location, 'rb')
+        self.mm = mmap_module.mmap(self.fp.fileno(), 0, access=mmap_module.ACCESS_READ) if self.offsets[-1] else b''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if start >= stop:
+                return []
+            offsets = self.offsets[start:stop + 1].tolist()
+            data = self.mm[offsets[0]:offsets[-1]]
+            return [data[offsets[i] - offsets[0]:offsets[i + 1] - offsets[0]].decode('utf-8')
+                    for i in range(len(offsets) - 1)]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("SentenceStore index out of range")
+        return self.mm[int(self.offsets[item]):int(self.offsets[item + 1])].decode('utf-8')
+
+    def __iter__(self, batch_size=1 << 16):
+        for start in range(0, len(self), batch_size):
+            yield from self[start:start + batch_size]
+
+    def __reduce__(self):
+        return SentenceStore, (self.location,)
+
+    def close(self):
+        if isinstance(self.mm, mmap_module.mmap):
+            self.mm.close()
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def write_sentence_store(sentences, location):
+    """
+    write an iterable of sentences (str) as a SentenceStore, streaming both the blob and the offsets to disk, so
+    memory stays constant whatever the number of sentences.
+    :return: number of sentences written.
+    """
+    import numpy as np
+    n = 0
+    offset = 0
+    offsets = array.array('Q', [0])
+    with open(location, 'wb') as fp, open(location + '.offsets.tmp', 'wb') as ofp:
+        for sentence in sentences:
+            data = sentence.encode('utf-8')
+            fp.write(data)
+            offset += len(data)
+            offsets.append(offset)
+            n += 1
+            if len(offsets) >= 1 << 20:
+                offsets.tofile(ofp)
+                offsets = array.array('Q')
+        offsets.tofile(ofp)
+    with open(location + '.offsets', 'wb') as fp, open(location + '.offsets.tmp', 'rb') as ofp:
+        np.lib.format.write_array_header_1_0(fp, {'descr': np.dtype(np.uint64).str, 'fortran_order': False,
+                                                  'shape': (n + 1,)})
+        shutil.copyfileobj(ofp, fp)
+    os.remove(location + '.offsets.tmp')
+    return n
+
+
+def serialize_file_to_sentence_store(file_location, location, strip=True):
+    """
+    like serialize_file_to_list, but store the lines of file_location as a SentenceStore in location.
+    strip: whether rstrip the lines.
+    """
+    with codecs.open(file_location, 'r', 'utf-8') as fpr:
+        return write_sentence_store((line.rstrip() if strip else line for line in fpr), location)
+
+
+def convert_pickle_to_sentence_store(pickle_location, location):
+    """
+    convert a pickled list of sentences (e.g. written by serialize_file_to_list) to a SentenceStore in location.
+    """
+    return write_sentence_store(deserialize(pickle_location), location)
+
+
+def disk_memoize(cache_dir, max_bytes=None, ttl=None):
+    """
+    decorator that caches the results of a function on disk, keyed by a sha256 of the pickled function name and
+    arguments (so the arguments have to be picklable). sets and dicts in the arguments are put in a canonical order
+    first (see helper_canonical_key), so the key does not depend on PYTHONHASHSEED or insertion order.
+    results are written with serialize to a temporary file which is then renamed, so several processes can share
+    cache_dir safely: readers never see a partial entry. a result that can not be serialized is returned uncached.
+    >>> @disk_memoize('/tmp/tokenized', max_bytes=10 * 1024 ** 3, ttl=24 * 3600)
+    ... def tokenize_corpus(path, lowercase=True):
+    ...     pass
+    >>> tokenize_corpus.cache_info()
+    {'hits': 0, 'misses': 0, 'entries': 0, 'bytes': 0}
+    :param cache_dir: created if missing.
+    :param max_bytes: None, or the cache size above which the least recently used entries are evicted.
+    :param ttl: None, or seconds after which an entry is recomputed.
+    """
+    from mzutils.os_funcs import mkdir_p
+    mkdir_p(cache_dir)
+
+    def decorator(func):
+        stats = {'hits': 0, 'misses': 0}
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = pickle.dumps(helper_canonical_key((func.__module__, func.__qualname__, args, kwargs)), protocol=4)
+            location = os.path.join(cache_dir, hashlib.sha256(key).hexdigest() + '.pkl')
+            try:
+                created, result = deserialize(location)
+                if ttl is None or time.time() - created < ttl:
+                    os.utime(location)  # mtime is the last access, for the lru eviction.
+                    stats['hits'] += 1
+                    return result
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                pass
+            stats['misses'] += 1
+            result = func(*args, **kwargs)
+            tmp_location = location + '.tmp' + uuid.uuid4().hex
+            try:
+                serialize((time.time(), result), tmp_location)
+                os.replace(tmp_location, location)
+            except Exception:  # e.g. an unpicklable result, which is still returned, just not cached.
+                return result
+            finally:
+                if os.path.exists(tmp_location):
+                    os.remove(tmp_location)
+            if max_bytes is not None:
+                helper_evict_lru(cache_dir, max_bytes)
+            return result
+
+        def cache_info():
+            entries = helper_cache_entries(cache_dir)
+            return dict(stats, entries=len(entries), bytes=sum(size for _, size, _ in entries))
+
+        def cache_clear():
+            for location, _, _ in helper_cache_entries(cache_dir):
+                try:
+                    os.remove(location)
+                except FileNotFoundError:
+                    pass
+
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
+
+
+# ------------------helper funcs-----------------------------
+
+
+class _CanonicalForm(tuple):
+    """
+    (type name, sorted items) standing for a set, frozenset or dict in helper_canonical_key. it pickles with a
+    reference to this class, so it never collides with a plain tuple argument of the same content.
+    """
+    __slots__ = ()
+
+
+def helper_canonical_key(obj):
+    """
+    a copy of obj whose pickle does not depend on hash randomization or insertion order: sets, frozensets and dicts
+    (also nested in lists and tuples) become _CanonicalForm tuples sorted by the pickle of their canonical items.
+    """
+    if isinstance(obj, (set, frozenset)):
+        items = [helper_canonical_key(item) for item in obj]
+        return _CanonicalForm((type(obj).__name__,
+                               tuple(sorted(items, key=lambda item: pickle.dumps(item, protocol=4)))))
+    if isinstance(obj, dict):
+        items = [(helper_canonical_key(key), helper_canonical_key(value)) for key, value in obj.items()]
+        return _CanonicalForm((type(obj).__name__,
+                               tuple(sorted(items, key=lambda item: pickle.dumps(item[0], protocol=4)))))
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(helper_canonical_key(item) for item in obj) if type(obj) in (list, tuple) else obj
+    return obj
+
+
+def helper_is_array_dict(obj):
+    """
+    whether obj is a non-empty dict of str -> numpy arrays (without python objects), i.e. can be stored as npz.
+    """
+    numpy = sys.modules.get('numpy')  # if numpy is not imported, obj holds no arrays.
+    return numpy is not None and isinstance(obj, dict) and len(obj) > 0 and all(
+        isinstance(key, str) and type(value) is numpy.ndarray and value.dtype != object for key, value in obj.items())
+
+
+def helper_pick_format(obj):
+    """
+    the format of SERIALIZE_FORMATS that serialize(obj, format='auto') uses: npz for a dict of str -> numpy arrays,
+    pickle otherwise. the check only looks at the top-level dict, builtin data is not walked to pick marshal, which
+    costs about as much as pickling it and is not faster overall.
+    """
+    if helper_is_array_dict(obj):
+        return 'npz'
+    return 'pickle'
+
+
+def helper_is_builtin_data(obj):
+    """
+    whether obj is made of builtin scalars, lists, tuples, sets and dicts only, which marshal stores exactly.
+    (marshal and msgpack would silently turn numpy arrays, bytearrays and other buffers into bytes.)
+    every container is walked once. a list, set or dict reached twice (shared, or a cycle like a = [1]; a.append(a))
+    makes this False, leaving such objects to pickle.
+    """
+    stack = [obj]
+    seen = set()
+    while stack:
+        obj = stack.pop()
+        obj_type = type(obj)
+        if obj_type in (str, int, float, bool, type(None), bytes, complex):
+            continue
+        if id(obj) in seen:
+            if obj_type in (tuple, frozenset):  # immutable, can not be part of a cycle.
+                continue
+            return False
+        seen.add(id(obj))
+        if obj_type in (list, tuple, set, frozenset):
+            stack.extend(obj)
+        elif obj_type is dict:
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        else:
+            return False
+    return True
+
+
+def helper_dumps(obj, format):
+    """
+    encode obj to bytes with one of SERIALIZE_FORMATS.
+    """
+    if format == 'msgpack':
+        import msgpack
+        return msgpack.packb(obj, use_bin_type=True, strict_types=True)
+    if format == 'marshal':
+        return marshal.dumps(obj)
+    if format == 'npz':
+        import numpy as np
+        if not helper_is_array_dict(obj):
+            raise TypeError("npz can only store a dict of str -> numpy arrays.")
+        # the same archive as np.savez, written by hand so that keys like 'file' or 'allow_pickle' do not clash with
+        # its parameters.
+        fp = io.BytesIO()
+        with zipfile.ZipFile(fp, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for key, value in obj.items():
+                with archive.open(key + '.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array(member, value, allow_pickle=False)
+        return fp.getvalue()
+    return pickle.dumps(obj)
+
+
+def helper_loads(data, format):
+    """
+    decode bytes written by helper_dumps.
+    """
+    if format == 'msgpack':
+        import msgpack
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    if format == 'marshal':
+        return marshal.loads(data)
+    if format == 'npz':
+        import numpy as np
+        with np.load(io.BytesIO(data)) as npz:
+            return dict(npz)
+    if format == 'pickle':
+        return pickle.loads(data)
+    raise ValueError("unknown serialization format " + str(format))
+
+
+def helper_cache_entries(cache_dir):
+    """
+    :return: list of (location, size, mtime) of the disk_memoize entries in cache_dir.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.pkl'):
+            location = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(location)
+            except FileNotFoundError:
+                continue  # evicted by another process meanwhile.
+            entries.append((location, stat.st_size, stat.st_mtime))
+    return entries
+
+
+def helper_evict_lru(cache_dir, max_bytes):
+    """
+    remove the least recently used disk_memoize entries of cache_dir until it holds at most max_bytes.
+    """
+    entries = sorted(helper_cache_entries(cache_dir), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    for location, size, _ in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(location)
+        except FileNotFoundError:
+            pass
+        total -= size
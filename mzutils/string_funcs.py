@@ -1,6 +1,5 @@
 import ast
 import codecs
-import pickle
 import re
 
 import nltk
@@ -53,20 +52,18 @@ def select_first_sentence(InputText, language='english'):
     return nltk.tokenize.sent_tokenize(InputText, language)[0]
 
 
-def py_serialize(filepath, itemlist):
+def py_serialize(filepath, itemlist, format='pickle'):
     """segment a long document to several small documents based on the nltk tokenized word length.
-    sentence structure will be kept.
-
+    format: see mzutils.serialize_funcs.serialize, e.g. 'pickle', 'marshal' or 'msgpack'.
+    format: see mzutils.serialize_funcs.serialize, 'auto' picks the fastest format able to store itemlist.
     """
-    with codecs.open(filepath, "wb+") as fp:
-        pickle.dump(itemlist, fp)
+    from mzutils.serialize_funcs import serialize
+    serialize(itemlist, filepath, compression=None, format=format)
 
 
 def py_deserialize(filepath):
-    itemlist = None
-    with codecs.open(filepath, 'rb') as fp:
-        itemlist = pickle.load(fp)
-    return itemlist
+    from mzutils.serialize_funcs import deserialize
+    return deserialize(filepath, compression=None)
 
 
 def str_rep_to_list(s):
@@ -0,0 +1,119 @@
+import codecs
+import csv
+import filecmp
+import os
+
+import pytest
+
+from mzutils.ctsv_funcs import TsvAppender, TsvIndex, partition_delimited_by_key, segment_large_tsv
+from mzutils.os_funcs import open_compressed
+
+
+def write_rows(path, line_break, stray_quote=False):
+    with codecs.open(path, 'w', encoding='utf-8') as fp:
+        writer = csv.writer(fp, delimiter='\t')
+        for i in range(200):
+            if stray_quote and i % 10 == 0:
+                # a b'"' in the middle of an unquoted field is a plain character to csv.reader.
+                fp.write('%d\t%d" screen\tsay "hi"\r\n' % (i, i % 7))
+                continue
+            writer.writerow([i, 'v%d' % i + (line_break if i % 25 == 3 else ''), '"q\n"' if i % 13 == 0 else 'é'])
+
+
+def assert_same_files(serial, parallel):
+    assert sorted(os.listdir(serial)) == sorted(os.listdir(parallel))
+    for name in os.listdir(serial):
+        assert filecmp.cmp(str(serial / name), str(parallel / name), shallow=False)
+
+
+@pytest.mark.parametrize('line_break', ['', ' ', '\x0c', '\x1c', '\x85', '\r'])
+@pytest.mark.parametrize('stray_quote', [False, True])
+@pytest.mark.parametrize('duplicate_header', [False, True])
+@pytest.mark.parametrize('segmentation_length', [17, 30])
+def test_parallel_segments_match_serial(tmp_path, line_break, stray_quote, duplicate_header, segmentation_length):
+    src = str(tmp_path / 'in.tsv')
+    write_rows(src, line_break, stray_quote)
+    serial, parallel = tmp_path / 'serial', tmp_path / 'parallel'
+    serial.mkdir()
+    parallel.mkdir()
+    n_serial = segment_large_tsv(src, str(serial), segmentation_length, duplicate_header)
+    n_parallel = segment_large_tsv(src, str(parallel), segmentation_length, duplicate_header, workers=2)
+    assert n_serial == n_parallel
+    assert_same_files(serial, parallel)
+
+
+@pytest.mark.parametrize('duplicate_header', [False, True])
+def test_parallel_partitions_match_serial(tmp_path, duplicate_header):
+    src = str(tmp_path / 'in.tsv')
+    write_rows(src, '', stray_quote=True)
+    serial, parallel = tmp_path / 'serial', tmp_path / 'parallel'
+    serial.mkdir()
+    parallel.mkdir()
+    partition_delimited_by_key(src, str(serial), 1, 3, duplicate_header=duplicate_header)
+    partition_delimited_by_key(src, str(parallel), 1, 3, duplicate_header=duplicate_header, workers=2)
+    with open(src, newline='', encoding='utf-8') as fp:
+        n_rows = sum(1 for _ in csv.reader(fp, delimiter='\t'))
+    n_partitioned = 0
+    for name in os.listdir(serial):
+        with open(str(serial / name), newline='', encoding='utf-8') as fp:
+            n_partitioned += sum(1 for _ in csv.reader(fp, delimiter='\t')) - duplicate_header
+    assert n_partitioned == n_rows - duplicate_header
+    assert_same_files(serial, parallel)
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as fp:
+        return list(csv.reader(fp, delimiter='\t'))
+
+
+@pytest.mark.parametrize('line_break', ['', '\x0c', '\x85', '\u2028'])
+def test_tsv_index_matches_csv_reader(tmp_path, line_break):
+    src = str(tmp_path / 'in.tsv')
+    write_rows(src, line_break, stray_quote=True)
+    rows = read_rows(src)
+    with TsvIndex(src) as index:
+        assert len(index) == len(rows) == 200
+        assert index[0] == rows[0]
+        assert index[11] == rows[11]
+        assert index[-1] == rows[-1]
+        assert index[10:21] == rows[10:21]
+        assert index[5:100:7] == rows[5:100:7]
+        assert index[50:10] == []
+        assert list(index) == rows
+        with pytest.raises(IndexError):
+            index[200]
+
+
+def test_tsv_index_rebuilds_stale_index(tmp_path):
+    src = str(tmp_path / 'in.tsv')
+    write_rows(src, '')
+    with TsvIndex(src) as index:
+        assert len(index) == 200
+    with open(src, 'a', encoding='utf-8', newline='') as fp:
+        fp.write('200\tnew\t"a\nb"\r\n')
+    stat = os.stat(src)
+    os.utime(src, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    with TsvIndex(src) as index:
+        assert len(index) == 201
+        assert index[-1] == ['200', 'new', 'a\nb']
+
+
+def test_tsv_index_rejects_bare_carriage_returns(tmp_path):
+    src = str(tmp_path / 'in.tsv')
+    with open(src, 'w', encoding='utf-8', newline='') as fp:
+        fp.write('0\t"a\rb"\n1\tc\rd\n')
+    with pytest.raises(ValueError):
+        TsvIndex(src)
+
+
+@pytest.mark.parametrize('extension', ['.tsv', '.tsv.gz', '.tsv.bz2', '.tsv.xz'])
+def test_tsv_appender_compresses_by_extension(tmp_path, extension):
+    path = str(tmp_path / ('log' + extension))
+    for run in range(2):
+        with TsvAppender(path, max_buffer_rows=3) as appender:
+            appender.writerows([[run, i, 'é'] for i in range(5)])
+    with open_compressed(path, 'r', encoding='utf-8') as fp:
+        rows = list(csv.reader(fp, delimiter='\t'))
+    assert rows == [[str(run), str(i), 'é'] for run in range(2) for i in range(5)]
+    with pytest.raises(ValueError):
+        appender.writerow([2, 0, 'é'])
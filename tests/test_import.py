@@ -0,0 +1,40 @@
+"""
+``import mzutils`` must stay cheap: submodules, and the heavy dependencies behind them, load on first use only.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('numpy', 'pandas', 'nltk', 'torch', 'torchvision', 'sklearn', 'tensorflow', 'pyarrow')
+# microseconds, cumulative -X importtime of the top-level mzutils entries. numpy alone takes more than that.
+IMPORT_BUDGET_US = 50000
+
+
+def run_python(*args):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    return subprocess.run([sys.executable, *args], cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+@pytest.mark.parametrize('statement', ['import mzutils', 'import mzutils; mzutils.read_tsv',
+                                       'import mzutils; mzutils.mkdir_p', 'import mzutils.ctsv_funcs'])
+def test_no_heavy_dependencies(statement):
+    out = run_python('-c', statement + '; import sys; print(" ".join(sorted(sys.modules)))').stdout.split()
+    assert [name for name in HEAVY_MODULES if name in out] == []
+
+
+def test_import_time_budget():
+    stderr = run_python('-X', 'importtime', '-c', 'import mzutils; mzutils.read_tsv').stderr
+    total = 0
+    for line in stderr.splitlines():
+        _, cumulative_us, name = line.split('|')
+        if name.startswith(' mzutils') and cumulative_us.strip().isdigit():  # top-level entries are indented once.
+            total += int(cumulative_us)
+    assert 0 < total < IMPORT_BUDGET_US
+
+
+def test_star_imported_names_still_resolve():
+    out = run_python('-c', 'import os, mzutils; print(mzutils.os is os, callable(mzutils.load_json))').stdout
+    assert out.split() == ['True', 'True']